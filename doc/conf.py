@@ -11,9 +11,9 @@
 # add these directories to sys.path here. If the directory is relative to the
 # documentation root, use os.path.abspath to make it absolute, like shown here.
 #
-# import os
-# import sys
-# sys.path.insert(0, os.path.abspath('.'))
+import os
+import sys
+sys.path.insert(0, os.path.abspath('sphinxext'))
 
 
 # -- Project information -----------------------------------------------------
@@ -33,12 +33,38 @@ release = '0.0'
 # ones.
 extensions = [
     'sphinx_gallery.gen_gallery',
+    'gallery_cache',
+    'gallery_report',
 ]
 
+# Number of worker processes used to run the examples, e.g.
+# ``make html GALLERY_JOBS=8``. By default this follows ``sphinx-build -j``.
+gallery_jobs = os.environ.get('GALLERY_JOBS')
+
 # Sphinx-gallery dirs
 sphinx_gallery_conf = {
      'examples_dirs': '../examples',   # path to your example scripts
      'gallery_dirs': 'auto_examples',  # path where to save gallery generated examples
+     # run examples in a process pool, outputs are merged in gallery order
+     'parallel': int(gallery_jobs) if gallery_jobs else True,
+     # time and memory of each example, see sphinxext/gallery_report.py;
+     # read_csv of URLs served from sphinxext/gallery_datasets.py
+     'reset_modules': ('matplotlib', 'seaborn',
+                       'gallery_report.profile_example',
+                       'gallery_datasets.use_cache'),
+     'reset_modules_order': 'both',
+}
+
+# Outputs of executed examples are cached here, keyed on the example source
+# and the versions of the libraries it imports (see sphinxext/gallery_cache.py)
+gallery_cache_dir = '_gallery_cache'
+
+# Wall time, CPU time, import time and peak RSS of each example are written to
+# <outdir>/gallery_report.json. The build fails if an example goes over its
+# budget ('*' applies to every example); times are in seconds, memory in bytes.
+gallery_report_file = 'gallery_report.json'
+gallery_budgets = {
+    '*': {'wall_time': 120},
 }
 
 # Add any paths that contain templates here, relative to this directory.
@@ -47,7 +73,7 @@ templates_path = ['_templates']
 # List of patterns, relative to source directory, that match files and
 # directories to ignore when looking for source files.
 # This pattern also affects html_static_path and html_extra_path.
-exclude_patterns = ['_build', 'Thumbs.db', '.DS_Store']
+exclude_patterns = ['_build', '_gallery_cache', 'Thumbs.db', '.DS_Store']
 
 
 # -- Options for HTML output -------------------------------------------------
@@ -0,0 +1,223 @@
+"""
+Persistent cache of executed gallery examples.
+
+Sphinx-Gallery only skips an example when the ``<example>.py.md5`` file next
+to its generated outputs matches the source. This extension keeps a copy of
+every successfully built example (rst, notebook, zip, figures and thumbnail)
+in a cache directory, keyed on the hash of the source *and* the versions of
+the libraries the example imports. At the start of the build the matching
+entry is copied back into the gallery directory so Sphinx-Gallery sees the
+example as up to date; if no entry matches (e.g. pandas was upgraded), the
+md5 file is removed so the example is re-run.
+
+Configuration (``conf.py``):
+
+* ``gallery_cache_dir`` - cache location, relative to the source directory.
+  ``None`` disables the cache.
+* ``gallery_cache_keep`` - number of entries kept per example.
+"""
+
+import ast
+import hashlib
+import json
+import platform
+import re
+import shutil
+import sys
+from importlib import metadata
+from pathlib import Path
+
+from sphinx.util import logging
+from sphinx_gallery.utils import get_md5sum
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+
+def imported_modules(src_file):
+    """Return the sorted top-level names of modules imported by `src_file`."""
+    tree = ast.parse(Path(src_file).read_bytes())
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split('.')[0])
+    return sorted(names - set(sys.stdlib_module_names))
+
+
+def library_versions(modules):
+    """Map each module name to the version of the distribution providing it.
+
+    Modules are not imported; versions come from the installed package
+    metadata, e.g. ``sklearn`` resolves to the ``scikit-learn`` distribution.
+    Modules that are not installed map to ``None``.
+    """
+    providers = metadata.packages_distributions()
+    versions = {}
+    for name in modules:
+        dists = providers.get(name, [name])
+        try:
+            versions[name] = metadata.version(dists[0])
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def example_key(src_file):
+    """Hash of the example source, the Python version and imported libraries."""
+    versions = library_versions(imported_modules(src_file))
+    h = hashlib.sha256(Path(src_file).read_bytes())
+    h.update(platform.python_version().encode())
+    h.update(json.dumps(versions, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+def example_outputs(gallery_dir, rel_src):
+    """Yield the files Sphinx-Gallery generated for one example.
+
+    Parameters
+    ----------
+    gallery_dir : pathlib.Path
+        Gallery (output) directory, e.g. ``doc/auto_examples``.
+    rel_src : pathlib.Path
+        Path of the example relative to its examples directory.
+    """
+    out_dir = gallery_dir / rel_src.parent
+    stem = rel_src.stem
+    yield from out_dir.glob(f'{stem}.*')
+    image_re = re.compile(rf'sphx_glr_{re.escape(stem)}_(\d{{3}}|thumb)\b.*')
+    for image_dir in (out_dir / 'images', out_dir / 'images' / 'thumb'):
+        if image_dir.is_dir():
+            yield from (f for f in image_dir.iterdir()
+                        if f.is_file() and image_re.fullmatch(f.name))
+
+
+class ExampleCache:
+    """Cache entries of all the examples of one gallery.
+
+    Entries live in ``<cache_dir>/<gallery>/<example>/<key>/`` and mirror
+    the layout of the gallery directory, so restoring one is a plain copy.
+    The manifest records which key each example in the gallery directory was
+    last restored from or stored as.
+    """
+
+    def __init__(self, cache_dir, examples_dir, gallery_dir, keep=3):
+        self.examples_dir = Path(examples_dir)
+        self.gallery_dir = Path(gallery_dir)
+        self.root = Path(cache_dir) / self.gallery_dir.name
+        self.keep = keep
+        manifest = self.root / MANIFEST
+        self.manifest = (json.loads(manifest.read_text())
+                         if manifest.exists() else {})
+
+    def examples(self):
+        return sorted(p.relative_to(self.examples_dir)
+                      for p in self.examples_dir.rglob('*.py'))
+
+    def _entry(self, rel_src, key):
+        return self.root / rel_src.with_suffix('') / key
+
+    def _md5_file(self, rel_src):
+        return self.gallery_dir / f'{rel_src}.md5'
+
+    def restore(self, rel_src):
+        """Make the gallery directory match the cached entry for `rel_src`.
+
+        Returns True if cached outputs will be used for the example.
+        """
+        key = example_key(self.examples_dir / rel_src)
+        entry = self._entry(rel_src, key)
+        md5_file = self._md5_file(rel_src)
+        if not entry.is_dir():
+            # outputs, if any, were built from another source or library
+            # versions: make sure Sphinx-Gallery does not reuse them
+            md5_file.unlink(missing_ok=True)
+            return False
+        cached_md5 = entry / f'{rel_src}.md5'
+        if (self.manifest.get(str(rel_src)) != key or not md5_file.exists()
+                or md5_file.read_text() != cached_md5.read_text()):
+            shutil.copytree(entry, self.gallery_dir, dirs_exist_ok=True)
+            self.manifest[str(rel_src)] = key
+        entry.touch()
+        return True
+
+    def store(self, rel_src):
+        """Copy the outputs of a successfully built example into the cache.
+
+        Returns True if a new entry was written.
+        """
+        md5_file = self._md5_file(rel_src)
+        target_file = self.gallery_dir / rel_src
+        # Sphinx-Gallery only writes the md5 once the example built correctly
+        if (not md5_file.exists()
+                or md5_file.read_text() != get_md5sum(target_file, mode='t')):
+            return False
+        key = example_key(self.examples_dir / rel_src)
+        entry = self._entry(rel_src, key)
+        if entry.is_dir():
+            return False
+        for fname in example_outputs(self.gallery_dir, rel_src):
+            dest = entry / fname.relative_to(self.gallery_dir)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(fname, dest)
+        self.manifest[str(rel_src)] = key
+        self._prune(entry.parent)
+        return True
+
+    def _prune(self, example_root):
+        entries = sorted(example_root.iterdir(), key=lambda p: p.stat().st_mtime)
+        for old in entries[:-self.keep]:
+            shutil.rmtree(old)
+
+    def save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        (self.root / MANIFEST).write_text(
+            json.dumps(self.manifest, indent=1, sort_keys=True))
+
+
+def _gallery_caches(app):
+    if app.config.gallery_cache_dir is None:
+        return []
+    srcdir = Path(app.srcdir)
+    cache_dir = srcdir / app.config.gallery_cache_dir
+    conf = app.config.sphinx_gallery_conf
+    return [ExampleCache(cache_dir, srcdir / examples_dir, srcdir / gallery_dir,
+                         keep=app.config.gallery_cache_keep)
+            for examples_dir, gallery_dir in zip(
+                _as_list(conf['examples_dirs']), _as_list(conf['gallery_dirs']))]
+
+
+def restore_examples(app):
+    """Copy cached outputs into the gallery before Sphinx-Gallery runs."""
+    for cache in _gallery_caches(app):
+        hits = [rel_src for rel_src in cache.examples() if cache.restore(rel_src)]
+        cache.save()
+        logger.info(f'gallery cache: {len(hits)}/{len(cache.examples())} '
+                    f'examples of {cache.gallery_dir.name} restored')
+
+
+def store_examples(app, exception):
+    """Cache the outputs of the examples built by this run."""
+    if exception is not None:
+        return
+    for cache in _gallery_caches(app):
+        stored = [rel_src for rel_src in cache.examples() if cache.store(rel_src)]
+        cache.save()
+        if stored:
+            logger.info(f'gallery cache: stored {", ".join(map(str, stored))}')
+
+
+def setup(app):
+    app.add_config_value('gallery_cache_dir', '_gallery_cache', 'env')
+    app.add_config_value('gallery_cache_keep', 3, 'env')
+    # before sphinx_gallery.gen_gallery.generate_gallery_rst (priority 500)
+    app.connect('builder-inited', restore_examples, priority=400)
+    # before summarize_failing_examples, which raises if any example failed
+    app.connect('build-finished', store_examples, priority=400)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
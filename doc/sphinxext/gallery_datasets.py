@@ -0,0 +1,235 @@
+"""
+Offline, memory-mapped cache of the datasets read by the examples.
+
+While an example that imports pandas runs, ``pandas.read_csv`` is replaced
+by :func:`read_csv`. Reading a URL the first time stores the resulting
+DataFrame in the cache, as ``.npy`` files per column; later reads memory-map
+those files instead of downloading and parsing the CSV again. String columns
+are stored dictionary encoded, as integer codes plus their categories, and
+nullable columns (``Int64``, ``boolean``, ...) as their values plus a mask.
+Columns of any other dtype raise TypeError instead of being cached lossily.
+
+The cache lives in ``$GALLERY_DATASETS``, by default
+``doc/_gallery_cache/datasets``. On hosts without network access, seed it
+from a local copy of the file::
+
+    python doc/sphinxext/gallery_datasets.py URL local_copy.csv
+"""
+
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# bumped when the layout of the stored datasets changes
+FORMAT = 2
+
+_original_read_csv = None
+
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+
+def cache_dir():
+    default = Path(__file__).parents[1] / '_gallery_cache' / 'datasets'
+    return Path(os.environ.get('GALLERY_DATASETS', default))
+
+
+def dataset_key(url, **kwargs):
+    """Cache key of ``read_csv(url, **kwargs)``."""
+    h = hashlib.sha256(url.encode())
+    h.update(repr(sorted(kwargs.items())).encode())
+    return h.hexdigest()[:16]
+
+
+def _encode(name, col):
+    """Arrays storing the Series `col`, and the metadata to restore it.
+
+    Raises TypeError for dtypes the cache cannot restore exactly.
+    """
+    import pandas as pd
+
+    column = {'name': name, 'dtype': str(col.dtype)}
+    dtype = col.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biufcmM':
+        column['encoding'] = 'numpy'
+        return column, {'values': col.to_numpy()}
+    if isinstance(col.array, (pd.arrays.IntegerArray, pd.arrays.FloatingArray,
+                              pd.arrays.BooleanArray)):
+        # nullable dtypes: the values plus the mask of missing values
+        column['encoding'] = 'masked'
+        values = col.to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+        return column, {'values': values, 'mask': col.isna().to_numpy()}
+    if isinstance(dtype, pd.CategoricalDtype):
+        categories = dtype.categories
+        if pd.api.types.infer_dtype(categories) not in (
+                'string', 'integer', 'floating', 'empty'):
+            raise TypeError(f'cannot cache column {name!r}: categories of '
+                            f'dtype {categories.dtype}')
+        column.update(encoding='categorical', categories=categories.tolist(),
+                      categories_dtype=str(categories.dtype),
+                      ordered=bool(dtype.ordered))
+        return column, {'values': col.cat.codes.to_numpy()}
+    if (dtype == object or isinstance(dtype, pd.StringDtype)) and \
+            pd.api.types.infer_dtype(col, skipna=True) in ('string', 'empty'):
+        # strings are dictionary encoded
+        codes, categories = pd.factorize(col)
+        column.update(encoding='strings', categories=categories.tolist())
+        return column, {'values': codes.astype(np.int32)}
+    raise TypeError(f'cannot cache column {name!r} of dtype {dtype}')
+
+
+def _decode(column, arrays):
+    """Series from the metadata and arrays written by :func:`_encode`."""
+    import pandas as pd
+
+    values = arrays['values']
+    encoding = column['encoding']
+    if encoding == 'numpy':
+        return pd.Series(values, copy=False)
+    if encoding == 'masked':
+        values = pd.array(values, dtype=column['dtype'])
+        values[arrays['mask']] = pd.NA
+        return pd.Series(values, copy=False)
+    if encoding == 'categorical':
+        categories = pd.Index(column['categories'],
+                              dtype=column['categories_dtype'])
+        return pd.Series(pd.Categorical.from_codes(
+            values, categories, ordered=column['ordered']))
+    # code -1 (missing) picks the trailing NaN
+    categories = np.array(column['categories'] + [np.nan], dtype=object)
+    return pd.Series(categories[values], dtype=column['dtype'])
+
+
+def store(df, path):
+    """Save `df` to the directory `path`, as ``.npy`` files per column.
+
+    Raises TypeError, before anything is written, if a column has a dtype
+    that :func:`load` could not restore.
+    """
+    import pandas as pd
+
+    path = Path(path)
+    index_names = []
+    if df.index.names != [None] or not df.index.equals(pd.RangeIndex(len(df))):
+        index_names = [name or f'level_{i}'
+                       for i, name in enumerate(df.index.names)]
+        df = df.reset_index(names=index_names)
+    meta = {'format': FORMAT, 'columns': [], 'index': index_names}
+    encoded = [_encode(name, col) for name, col in df.items()]
+    path.mkdir(parents=True, exist_ok=True)
+    for i, (column, arrays) in enumerate(encoded):
+        column['files'] = {}
+        for part, values in arrays.items():
+            column['files'][part] = f'{i}.{part}.npy'
+            np.save(path / column['files'][part], values, allow_pickle=False)
+        meta['columns'].append(column)
+    # written last, so an interrupted store is not mistaken for a dataset
+    (path / 'meta.json').write_text(json.dumps(meta, indent=1))
+
+
+def is_stored(path):
+    """Whether `path` holds a dataset :func:`load` can read."""
+    try:
+        meta = json.loads((Path(path) / 'meta.json').read_text())
+    except FileNotFoundError:
+        return False
+    return meta.get('format') == FORMAT
+
+
+def load(path):
+    """Load a DataFrame saved with :func:`store`, memory-mapping its columns.
+
+    Columns of NumPy dtypes are mapped copy-on-write, so the DataFrame can be
+    modified without touching the cache. Every column gets back the dtype it
+    was stored with.
+    """
+    import pandas as pd
+
+    path = Path(path)
+    meta = json.loads((path / 'meta.json').read_text())
+    data = {}
+    for column in meta['columns']:
+        arrays = {part: np.load(path / file, mmap_mode='c')
+                  for part, file in column['files'].items()}
+        data[column['name']] = _decode(column, arrays)
+    df = pd.DataFrame(data, copy=False)
+    if meta['index']:
+        df = df.set_index(meta['index'])
+    return df
+
+
+def add(url, source=None, **kwargs):
+    """Store ``read_csv(source or url, **kwargs)`` in the cache under `url`."""
+    import pandas as pd
+
+    read = _original_read_csv or pd.read_csv
+    df = read(source or url, **kwargs)
+    store(df, cache_dir() / dataset_key(url, **kwargs))
+    return df
+
+
+def read_csv(filepath_or_buffer, *args, **kwargs):
+    """``pandas.read_csv`` that serves URLs from the dataset cache."""
+    import pandas as pd
+
+    read = _original_read_csv or pd.read_csv
+    if args or not isinstance(filepath_or_buffer, str) or \
+            not filepath_or_buffer.startswith(('http://', 'https://', 'ftp://')):
+        return read(filepath_or_buffer, *args, **kwargs)
+    path = cache_dir() / dataset_key(filepath_or_buffer, **kwargs)
+    if not is_stored(path):
+        add(filepath_or_buffer, **kwargs)
+    return load(path)
+
+
+def install():
+    """Replace ``pandas.read_csv`` by :func:`read_csv`."""
+    global _original_read_csv
+    import pandas as pd
+
+    if _original_read_csv is None:
+        _original_read_csv = pd.read_csv
+        pd.read_csv = read_csv
+
+
+def uninstall():
+    """Restore the original ``pandas.read_csv``."""
+    global _original_read_csv
+    if _original_read_csv is not None:
+        import pandas as pd
+
+        pd.read_csv = _original_read_csv
+        _original_read_csv = None
+
+
+def use_cache(gallery_conf, fname, when):
+    """Sphinx-Gallery ``reset_modules`` hook routing ``read_csv`` to the cache.
+
+    Only examples that import pandas are affected.
+    """
+    from gallery_cache import imported_modules
+
+    if fname is None:
+        return
+    if when == 'after':
+        uninstall()
+        return
+    src_dir = Path(gallery_conf['src_dir'])
+    for examples_dir in _as_list(gallery_conf['examples_dirs']):
+        src_file = src_dir / examples_dir / fname
+        if src_file.exists() and 'pandas' in imported_modules(src_file):
+            install()
+            return
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.exit(f'usage: {sys.argv[0]} URL [LOCAL_COPY]')
+    df = add(*sys.argv[1:])
+    print(f'cached {sys.argv[1]}: {df.shape[0]} rows x {df.shape[1]} columns '
+          f'in {cache_dir() / dataset_key(sys.argv[1])}')
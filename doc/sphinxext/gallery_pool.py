@@ -0,0 +1,196 @@
+"""
+Run the gallery examples in a pool of pre-warmed, forking workers.
+
+Sphinx-Gallery executes examples either in the Sphinx process or in fresh
+loky worker processes (``GALLERY_JOBS``), where each worker pays the import
+cost of numpy, pandas, matplotlib and scikit-learn. This runner imports those
+modules once, forks the worker pool from the warm parent and runs every
+example in a child forked from its worker, so module state changed by one
+example never leaks into the next. As in the docs build, ``read_csv`` of URLs
+is served from the dataset cache (see ``gallery_datasets``). Example output is
+discarded; only the status, run time and traceback of failures are reported.
+
+It is meant for quickly checking that all examples still run, and for
+comparing cold and warm start up::
+
+    python doc/sphinxext/gallery_pool.py examples --jobs 4
+    python doc/sphinxext/gallery_pool.py examples --benchmark
+
+Requires ``os.fork`` (Linux, macOS).
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import runpy
+import subprocess
+import sys
+import time
+import traceback
+from pathlib import Path
+
+PRELOAD = ('numpy', 'pandas', 'matplotlib.pyplot', 'sklearn')
+
+
+def preload(modules=PRELOAD):
+    """Import `modules`, returning the time each took in seconds.
+
+    Modules that are not installed are skipped.
+    """
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    times = {}
+    for name in modules:
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        times[name] = time.perf_counter() - t0
+    return times
+
+
+def _exec_example(path):
+    """Run the example at `path` as ``__main__``, from its own directory."""
+    from gallery_cache import imported_modules
+
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    # as in run_cold: pandas is preloaded, so check what the example imports
+    if 'pandas' in imported_modules(path):
+        import gallery_datasets
+        gallery_datasets.install()
+    os.chdir(path.parent)
+    sys.argv = [str(path)]
+    runpy.run_path(str(path), run_name='__main__')
+
+
+def run_forked(path):
+    """Run one example in a forked child.
+
+    Returns ``(path, ok, seconds, error)``, where `error` is the traceback
+    the child sent through a pipe if the example failed.
+    """
+    path = Path(path).resolve()
+    read_fd, write_fd = os.pipe()
+    t0 = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        status = 0
+        try:
+            _exec_example(path)
+        except SystemExit as exc:
+            if exc.code not in (None, 0):
+                os.write(write_fd, traceback.format_exc().encode())
+                status = 1
+        except BaseException:
+            os.write(write_fd, traceback.format_exc().encode())
+            status = 1
+        finally:
+            os._exit(status)
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as pipe:
+        error = pipe.read().decode()
+    _, status = os.waitpid(pid, 0)
+    elapsed = time.perf_counter() - t0
+    return str(path), os.waitstatus_to_exitcode(status) == 0, elapsed, error
+
+
+def run_warm(examples, jobs=1, modules=PRELOAD):
+    """Run `examples` in `jobs` workers forked from a preloaded parent."""
+    preload(modules)
+    ctx = multiprocessing.get_context('fork')
+    with ctx.Pool(jobs) as pool:
+        # imap keeps the results in the order of `examples`
+        return list(pool.imap(run_forked, examples))
+
+
+# Run in the new interpreter of run_cold: the example, with read_csv routed
+# to the dataset cache when it imports pandas, as in _exec_example.
+_COLD_CHILD = """\
+import runpy, sys
+path, datasets = sys.argv[1:]
+if datasets == 'datasets':
+    import gallery_datasets
+    gallery_datasets.install()
+sys.argv = [path]
+runpy.run_path(path, run_name='__main__')
+"""
+
+
+def run_cold(path):
+    """Run one example in a new interpreter, like :func:`run_forked`."""
+    from gallery_cache import imported_modules
+
+    path = Path(path).resolve()
+    datasets = 'pandas' in imported_modules(path)
+    pythonpath = os.pathsep.join(
+        filter(None, [str(Path(__file__).parent),
+                      os.environ.get('PYTHONPATH')]))
+    env = dict(os.environ, MPLBACKEND='Agg', PYTHONPATH=pythonpath)
+    cmd = [sys.executable, '-c', _COLD_CHILD, str(path),
+           'datasets' if datasets else 'none']
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=path.parent, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    elapsed = time.perf_counter() - t0
+    return str(path), proc.returncode == 0, elapsed, proc.stderr.decode()
+
+
+def benchmark(examples, modules=PRELOAD):
+    """Time every example run cold (new interpreter) and warm (forked).
+
+    The totals only cover the examples that succeeded both ways; the others
+    are listed under ``'failed'`` with their errors.
+    """
+    cold = [run_cold(path) for path in examples]
+    t0 = time.perf_counter()
+    startup = preload(modules)
+    preload_time = time.perf_counter() - t0
+    warm = [run_forked(path) for path in examples]
+    ok = [(c, w) for c, w in zip(cold, warm) if c[1] and w[1]]
+    return {
+        'preload': {'total': preload_time, 'modules': startup},
+        'examples': {
+            Path(c[0]).name: {'cold': c[2], 'warm': w[2],
+                              'ok_cold': c[1], 'ok_warm': w[1]}
+            for c, w in zip(cold, warm)
+        },
+        'failed': {
+            Path(c[0]).name: {'cold': c[3], 'warm': w[3]}
+            for c, w in zip(cold, warm) if not (c[1] and w[1])
+        },
+        'total': {'examples': len(ok),
+                  'cold': sum(c[2] for c, _ in ok),
+                  'warm': preload_time + sum(w[2] for _, w in ok)},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('examples_dir', type=Path)
+    parser.add_argument('--pattern', default='plot_*.py')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--benchmark', action='store_true',
+                        help='compare cold and warm start up, as JSON')
+    args = parser.parse_args(argv)
+    examples = sorted(args.examples_dir.glob(args.pattern))
+
+    if args.benchmark:
+        print(json.dumps(benchmark(examples), indent=1))
+        return 0
+
+    failed = 0
+    for path, ok, elapsed, error in run_warm(examples, args.jobs):
+        print(f'{"ok" if ok else "FAILED":6} {elapsed:7.2f}s  {Path(path).name}')
+        if not ok:
+            failed += 1
+            print(error)
+    return int(failed > 0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
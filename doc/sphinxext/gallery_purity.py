@@ -0,0 +1,376 @@
+"""
+Static purity analysis of the code blocks of the gallery examples.
+
+Every code block of an example (the code between two ``# %%`` text blocks) is
+analysed with ``ast`` and ``symtable``, without running it, and recorded as:
+
+* ``reads`` - global names the block uses, other than builtins.
+* ``writes`` - global names the block binds (assignment, ``import``, ``def``,
+  ...) or may mutate (``x[0] = 1``, ``x.attr = 1``, ``x.append(1)``).
+* ``impure`` - why the block may give different outputs from the same inputs:
+  it reads the network or files, draws random numbers, looks at the clock or
+  at object identities (``id()``), etc. A block defining a function that does
+  any of this is impure too.
+
+From the analysis of an earlier build, :func:`plan` works out which blocks
+have to be rendered again: impure blocks, changed blocks and blocks reading a
+name written by one of those. Every other block could reuse its previous
+outputs. As the examples run top to bottom in one namespace, the blocks the
+stale ones read from also have to be executed, but not rendered.
+
+Sphinx-Gallery runs examples as a whole, so this is used to report how much
+of a rebuild could be skipped::
+
+    python doc/sphinxext/gallery_purity.py examples
+    python doc/sphinxext/gallery_purity.py examples --json > blocks.json
+    # edit some examples, then
+    python doc/sphinxext/gallery_purity.py examples --since blocks.json
+"""
+
+import argparse
+import ast
+import builtins
+import hashlib
+import json
+import symtable
+import sys
+from pathlib import Path
+
+from sphinx_gallery.py_source_parser import split_code_and_text_blocks
+
+# Fully qualified names of the callables making a block impure, and why. An
+# entry also covers the names below it, e.g. 'numpy.random' covers
+# 'numpy.random.default_rng'. Only the parts of os reading or changing the
+# environment, files or processes are listed: helpers such as os.path.join
+# are pure.
+IMPURE_CALLS = {
+    'builtins.open': 'file',
+    'builtins.input': 'input',
+    'builtins.id': 'identity',
+    'sys.getrefcount': 'identity',
+    'io.open': 'file',
+    'os.environ': 'environment',
+    'os.getenv': 'environment',
+    'os.getcwd': 'environment',
+    'os.cpu_count': 'environment',
+    'os.getpid': 'process',
+    'os.system': 'process',
+    'os.popen': 'process',
+    'os.fork': 'process',
+    'os.kill': 'process',
+    'os.urandom': 'random',
+    'os.times': 'clock',
+    'os.listdir': 'file',
+    'os.scandir': 'file',
+    'os.walk': 'file',
+    'os.stat': 'file',
+    'os.lstat': 'file',
+    'os.open': 'file',
+    'os.fdopen': 'file',
+    'os.read': 'file',
+    'os.write': 'file',
+    'os.remove': 'file',
+    'os.unlink': 'file',
+    'os.rename': 'file',
+    'os.replace': 'file',
+    'os.mkdir': 'file',
+    'os.makedirs': 'file',
+    'os.rmdir': 'file',
+    'os.chdir': 'file',
+    'os.path.exists': 'file',
+    'os.path.isfile': 'file',
+    'os.path.isdir': 'file',
+    'os.path.getsize': 'file',
+    'os.path.getmtime': 'file',
+    'os.path.realpath': 'file',
+    'shutil': 'file',
+    'tempfile': 'file',
+    'pathlib': 'file',
+    'numpy.load': 'file',
+    'numpy.loadtxt': 'file',
+    'numpy.genfromtxt': 'file',
+    'numpy.fromfile': 'file',
+    'numpy.memmap': 'file',
+    'numpy.save': 'file',
+    'numpy.random': 'random',
+    'random': 'random',
+    'secrets': 'random',
+    'uuid': 'random',
+    'time': 'clock',
+    'timeit': 'clock',
+    'datetime.datetime.now': 'clock',
+    'datetime.datetime.today': 'clock',
+    'datetime.date.today': 'clock',
+    'tracemalloc': 'memory',
+    'resource': 'memory',
+    'gc': 'memory',
+    'urllib': 'network',
+    'http': 'network',
+    'socket': 'network',
+    'requests': 'network',
+    'subprocess': 'process',
+    'multiprocessing': 'process',
+    'threading': 'process',
+    'concurrent': 'process',
+    'asyncio': 'process',
+}
+# readers of pandas: reading a URL is 'network', anything else is 'file'
+READERS = ('pandas.read_', 'sklearn.datasets.fetch_')
+# methods reading or writing files, whatever the object they are called on
+FILE_METHODS = {'read_text', 'read_bytes', 'write_text', 'write_bytes',
+                'tofile', 'to_csv', 'to_pickle', 'to_parquet', 'to_json',
+                'to_excel', 'savefig'}
+URL_PREFIXES = ('http://', 'https://', 'ftp://')
+# read without a call
+ENVIRONMENT = {'os.environ', 'sys.argv'}
+BUILTINS = frozenset(dir(builtins))
+
+
+def _dotted(node):
+    """``'a.b.c'`` for the expression ``a.b.c``, None for anything else."""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(node.id)
+    return '.'.join(reversed(parts))
+
+
+def _root_name(node):
+    """Name at the root of ``a.b[0].c``, None if there is none."""
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Starred)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def _update_aliases(tree, aliases):
+    """Record the modules and objects imported by `tree` in `aliases`."""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    aliases[alias.asname] = alias.name
+                else:
+                    top = alias.name.split('.')[0]
+                    aliases[top] = top
+        elif isinstance(node, ast.ImportFrom) and node.module \
+                and not node.level:
+            for alias in node.names:
+                aliases[alias.asname or alias.name] = \
+                    f'{node.module}.{alias.name}'
+
+
+def _qualified(name, aliases):
+    """Resolve the dotted `name` through the import `aliases`."""
+    head, _, tail = name.partition('.')
+    if head in aliases:
+        head = aliases[head]
+    elif head in BUILTINS:
+        head = f'builtins.{head}'
+    return f'{head}.{tail}' if tail else head
+
+
+def _impure_reason(call, aliases):
+    """Why `call` makes a block impure, None if it does not."""
+    func = call.func
+    if isinstance(func, ast.Attribute) and func.attr in FILE_METHODS:
+        return 'file'
+    name = _dotted(func)
+    if name is None:
+        return None
+    name = _qualified(name, aliases)
+    if name.startswith(READERS):
+        source = call.args[0] if call.args else None
+        if (isinstance(source, ast.Constant) and isinstance(source.value, str)
+                and source.value.startswith(URL_PREFIXES)):
+            return 'network'
+        return 'file'
+    parts = name.split('.')
+    for i in range(len(parts), 0, -1):
+        reason = IMPURE_CALLS.get('.'.join(parts[:i]))
+        if reason is not None:
+            return reason
+    return None
+
+
+def _symbol_names(table):
+    """Global names read and bound by `table` and its nested scopes."""
+    reads, writes = set(), set()
+    top_level = table.get_type() == 'module'
+    for sym in table.get_symbols():
+        name = sym.get_name()
+        if top_level or sym.is_global():
+            if sym.is_referenced():
+                reads.add(name)
+            if sym.is_assigned() or sym.is_imported() or \
+                    (top_level and sym.is_namespace()):
+                writes.add(name)
+    for child in table.get_children():
+        child_reads, child_writes = _symbol_names(child)
+        reads |= child_reads
+        writes |= child_writes
+    return reads, writes
+
+
+def _local_names(func):
+    """Names bound by the function or lambda `func` (approximately)."""
+    args = func.args
+    names = {a.arg for a in args.posonlyargs + args.args + args.kwonlyargs}
+    names.update(a.arg for a in (args.vararg, args.kwarg) if a)
+    names.update(node.id for node in ast.walk(func)
+                 if isinstance(node, ast.Name)
+                 and isinstance(node.ctx, ast.Store))
+    return names
+
+
+def _mutated_names(tree, aliases, local=frozenset()):
+    """Global names whose object `tree` may modify in place."""
+    names = set()
+    for node in ast.iter_child_nodes(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                             ast.Lambda)):
+            names |= _mutated_names(node, aliases,
+                                    local | _local_names(node))
+            continue
+        names |= _mutated_names(node, aliases, local)
+        targets = []
+        if isinstance(node, (ast.Assign, ast.Delete)):
+            targets = node.targets
+        elif isinstance(node, (ast.AugAssign, ast.AnnAssign)):
+            targets = [node.target]
+        elif isinstance(node, ast.Call) and \
+                isinstance(node.func, ast.Attribute):
+            targets = [node.func.value]
+        for target in targets:
+            if isinstance(target, (ast.Attribute, ast.Subscript)) or \
+                    isinstance(node, ast.Call):
+                name = _root_name(target)
+                if name is not None and name not in aliases \
+                        and name not in local:
+                    names.add(name)
+    return names
+
+
+def analyze_block(source, aliases, filename='<block>'):
+    """Analyse one code block.
+
+    `aliases` maps the names imported by the earlier blocks of the example
+    to what they refer to (e.g. ``{'np': 'numpy'}``) and is updated with the
+    imports of this block.
+    """
+    tree = ast.parse(source, filename)
+    _update_aliases(tree, aliases)
+    reads, writes = _symbol_names(symtable.symtable(source, filename, 'exec'))
+    writes |= _mutated_names(tree, aliases)
+    impure = {reason for node in ast.walk(tree)
+              if isinstance(node, ast.Call)
+              for reason in [_impure_reason(node, aliases)] if reason}
+    # os.environ['X'] reads the environment without calling anything
+    if any(isinstance(node, ast.Attribute)
+           and _qualified(_dotted(node) or '', aliases) in ENVIRONMENT
+           for node in ast.walk(tree)):
+        impure.add('environment')
+    impure = sorted(impure)
+    return {
+        'hash': hashlib.sha256(source.encode()).hexdigest()[:16],
+        'pure': not impure,
+        'impure': impure,
+        'reads': sorted(reads - (BUILTINS - writes)),
+        'writes': sorted(writes),
+    }
+
+
+def analyze_example(src_file):
+    """Analyse every code block of the example `src_file`, in order."""
+    _, blocks = split_code_and_text_blocks(str(src_file))
+    aliases = {}
+    analysis = []
+    for label, content, lineno in blocks:
+        if label != 'code' or not content.strip():
+            continue
+        block = analyze_block(content, aliases, f'{src_file}:{lineno}')
+        analysis.append({'lineno': lineno, **block})
+    return analysis
+
+
+def plan(blocks, previous=None):
+    """Decide which blocks of one example have to run again.
+
+    Parameters
+    ----------
+    blocks : list of dict
+        Current analysis of the example, from :func:`analyze_example`.
+    previous : list of dict, optional
+        Analysis of the example when its outputs were last built. All blocks
+        are stale without it.
+
+    Returns
+    -------
+    stale : list of int
+        Indices of the blocks whose outputs have to be generated again.
+    execute : list of int
+        Indices of the blocks to execute: the stale ones and the blocks
+        defining the names they read.
+    """
+    previous = previous or []
+    stale = set()
+    changed_names = set()
+    for i, block in enumerate(blocks):
+        unchanged = i < len(previous) and previous[i]['hash'] == block['hash']
+        if (not block['pure'] or not unchanged
+                or changed_names.intersection(block['reads'])):
+            stale.add(i)
+            changed_names.update(block['writes'])
+    execute = set(stale)
+    needed = set()
+    for i in reversed(range(len(blocks))):
+        block = blocks[i]
+        if i in execute or needed.intersection(block['writes']):
+            execute.add(i)
+            needed.update(block['reads'])
+    return sorted(stale), sorted(execute)
+
+
+def analyze(examples_dir, pattern='plot_*.py'):
+    """Analyse the examples of `examples_dir`, keyed by file name."""
+    return {path.name: analyze_example(path)
+            for path in sorted(Path(examples_dir).glob(pattern))}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('examples_dir', type=Path)
+    parser.add_argument('--pattern', default='plot_*.py')
+    parser.add_argument('--json', action='store_true',
+                        help='print the analysis as JSON')
+    parser.add_argument('--since', type=Path,
+                        help='JSON analysis of the last build, to plan a '
+                             'rebuild against')
+    args = parser.parse_args(argv)
+    examples = analyze(args.examples_dir, args.pattern)
+
+    if args.json:
+        print(json.dumps(examples, indent=1))
+        return 0
+
+    previous = json.loads(args.since.read_text()) if args.since else {}
+    totals = {'blocks': 0, 'impure': 0, 'stale': 0, 'execute': 0}
+    for name, blocks in examples.items():
+        stale, execute = plan(blocks, previous.get(name))
+        impure = [b for b in blocks if not b['pure']]
+        print(f'{name}: {len(blocks)} blocks, {len(impure)} impure, '
+              f'{len(stale)} stale, {len(execute)} to execute')
+        for block in impure:
+            print(f'    line {block["lineno"]:4}: {", ".join(block["impure"])}')
+        totals['blocks'] += len(blocks)
+        totals['impure'] += len(impure)
+        totals['stale'] += len(stale)
+        totals['execute'] += len(execute)
+    print('total: ' + ', '.join(f'{v} {k}' for k, v in totals.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
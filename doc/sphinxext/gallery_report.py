@@ -0,0 +1,197 @@
+"""
+Per-example build cost report.
+
+``profile_example`` is registered as a Sphinx-Gallery ``reset_modules``
+callable (with ``reset_modules_order = 'both'``), so it is called right
+before and after each example runs, in whichever process runs it. It
+measures:
+
+* ``wall_time`` - seconds spent building the example (execution, scraping
+  and writing the rst).
+* ``cpu_time`` - CPU seconds used by the process over the same period.
+* ``import_time`` - seconds spent in top level ``import`` statements. Modules
+  already imported by a previous example in the same process are free.
+* ``peak_rss`` - peak resident set size in bytes. On Linux the high water mark
+  is reset before each example, elsewhere it is the peak of the process.
+
+Each measurement is saved next to the example outputs as
+``<example>.profile.json`` (and so is kept by ``gallery_cache``). At the end
+of the build they are collected into ``gallery_report_file`` and checked
+against ``gallery_budgets``, e.g.::
+
+    gallery_budgets = {'*': {'wall_time': 120},
+                       'plot_pandas.py': {'wall_time': 10, 'peak_rss': 5e8}}
+
+The build fails if any example exceeds its budget.
+"""
+
+import builtins
+import json
+import resource
+import time
+from pathlib import Path
+
+from sphinx.errors import ExtensionError
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+_CLEAR_REFS = Path('/proc/self/clear_refs')
+_STATUS = Path('/proc/self/status')
+
+# state of the example currently running in this process
+_running = {}
+# start of the current build, profiles older than this were cached
+_build_start = 0.0
+
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _reset_peak_rss():
+    """Reset the peak RSS of the process, returns False if not supported."""
+    try:
+        _CLEAR_REFS.write_text('5')
+    except OSError:
+        return False
+    return True
+
+
+def _peak_rss():
+    """Peak resident set size of the process, in bytes."""
+    try:
+        for line in _STATUS.read_text().splitlines():
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # kilobytes on Linux, bytes on macOS; only the former gets here in practice
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ImportTimer:
+    """Accumulate the time spent in outermost ``import`` statements.
+
+    Imports triggered while another import is running are included in the
+    time of the outer one.
+    """
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self._depth = 0
+        self._import = None
+
+    def __call__(self, *args, **kwargs):
+        if self._depth:
+            return self._import(*args, **kwargs)
+        self._depth += 1
+        t0 = time.perf_counter()
+        try:
+            return self._import(*args, **kwargs)
+        finally:
+            self.elapsed += time.perf_counter() - t0
+            self._depth -= 1
+
+    def start(self):
+        self._import = builtins.__import__
+        builtins.__import__ = self
+
+    def stop(self):
+        if builtins.__import__ is self:
+            builtins.__import__ = self._import
+
+
+def _profile_file(gallery_conf, fname):
+    """Path of the profile of `fname`, next to its generated rst."""
+    src_dir = Path(gallery_conf['src_dir'])
+    for examples_dir, gallery_dir in zip(_as_list(gallery_conf['examples_dirs']),
+                                         _as_list(gallery_conf['gallery_dirs'])):
+        if (src_dir / examples_dir / fname).exists():
+            target = src_dir / gallery_dir / fname
+            return target.with_name(f'{target.stem}.profile.json')
+    return None
+
+
+def profile_example(gallery_conf, fname, when):
+    """Sphinx-Gallery ``reset_modules`` hook measuring each example."""
+    if fname is None:
+        # entering a directory of examples
+        return
+    if when == 'before':
+        timer = ImportTimer()
+        _running.update(fname=fname, import_timer=timer,
+                        rss_reset=_reset_peak_rss(),
+                        wall=time.perf_counter(), cpu=time.process_time())
+        timer.start()
+        return
+    if _running.get('fname') != fname:
+        return
+    wall_time = time.perf_counter() - _running['wall']
+    cpu_time = time.process_time() - _running['cpu']
+    timer = _running['import_timer']
+    timer.stop()
+    profile = {
+        'wall_time': wall_time,
+        'cpu_time': cpu_time,
+        'import_time': timer.elapsed,
+        'peak_rss': _peak_rss(),
+        'peak_rss_is_per_example': _running['rss_reset'],
+        'timestamp': time.time(),
+    }
+    _running.clear()
+    profile_file = _profile_file(gallery_conf, fname)
+    if profile_file is not None:
+        profile_file.write_text(json.dumps(profile, indent=1))
+
+
+def _over_budget(name, profile, budgets):
+    budget = {**budgets.get('*', {}), **budgets.get(name, {})}
+    return [f'{name}: {metric} = {profile[metric]:.4g} > {limit:.4g}'
+            for metric, limit in sorted(budget.items())
+            if profile.get(metric, 0) > limit]
+
+
+def mark_build_start(app):
+    global _build_start
+    _build_start = time.time()
+
+
+def write_report(app, exception):
+    """Collect the example profiles and check them against the budgets."""
+    if exception is not None:
+        return
+    srcdir = Path(app.srcdir)
+    conf = app.config.sphinx_gallery_conf
+    report = {}
+    for examples_dir, gallery_dir in zip(_as_list(conf['examples_dirs']),
+                                         _as_list(conf['gallery_dirs'])):
+        for src in sorted((srcdir / examples_dir).rglob('*.py')):
+            rel_src = src.relative_to(srcdir / examples_dir)
+            profile_file = (srcdir / gallery_dir / rel_src).with_suffix(
+                '.profile.json')
+            if not profile_file.exists():
+                continue
+            profile = json.loads(profile_file.read_text())
+            profile['cached'] = profile['timestamp'] < _build_start
+            report[str(Path(gallery_dir) / rel_src)] = profile
+    report_file = Path(app.outdir) / app.config.gallery_report_file
+    report_file.parent.mkdir(parents=True, exist_ok=True)
+    report_file.write_text(json.dumps(report, indent=1, sort_keys=True))
+    logger.info(f'gallery report written to {report_file}')
+
+    budgets = app.config.gallery_budgets
+    over = [msg for name, profile in report.items()
+            for msg in _over_budget(Path(name).name, profile, budgets)]
+    if over:
+        raise ExtensionError('Gallery examples over budget:\n'
+                             + '\n'.join(over))
+
+
+def setup(app):
+    app.add_config_value('gallery_report_file', 'gallery_report.json', 'env')
+    app.add_config_value('gallery_budgets', {}, 'env')
+    app.connect('builder-inited', mark_build_start, priority=400)
+    # before summarize_failing_examples, which raises if any example failed
+    app.connect('build-finished', write_report, priority=450)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
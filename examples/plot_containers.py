@@ -54,6 +54,113 @@ for word in words:
 
 by_letter
 
+# %%
+# Grouping many items
+# ===================
+#
+# To group the words themselves, append each word to the list returned by
+# ``setdefault`` (or use ``collections.defaultdict(list)``). With tens of
+# millions of items the Python loop is the bottleneck. Two alternatives:
+#
+# * sort the (key, item) pairs and split them where the key changes
+# * with NumPy, encode the keys as integers (``np.unique`` with
+#   ``return_inverse=True`` gives the group of each item), sort the items by
+#   group with ``np.argsort`` and split them with ``np.split``. Short fixed
+#   width strings, such as the first letter (``'U1'``), can be viewed as
+#   integers, which are much faster to sort than strings.
+
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+
+def group_dict(keys, items):
+    groups = defaultdict(list)
+    for key, item in zip(keys, items):
+        groups[key].append(item)
+    return dict(groups)
+
+def group_sort(keys, items):
+    pairs = sorted(zip(keys, items), key=itemgetter(0))
+    return {key: [item for _, item in group]
+            for key, group in groupby(pairs, key=itemgetter(0))}
+
+def group_numpy(keys, items):
+    keys, items = np.asarray(keys), np.asarray(items)
+    encoded = keys
+    if keys.dtype.kind == 'U' and keys.itemsize in (4, 8):
+        encoded = keys.view(f'u{keys.itemsize}')
+    uniques, codes = np.unique(encoded, return_inverse=True)
+    # stable argsort of small integers is a radix sort
+    codes = codes.astype(np.min_scalar_type(len(uniques)))
+    order = np.argsort(codes, kind='stable')
+    ends = np.cumsum(np.bincount(codes))[:-1]
+    return dict(zip(uniques.view(keys.dtype).tolist(),
+                    np.split(items[order], ends)))
+
+def group_by(keys, items, backend='auto'):
+    """Group ``items`` by ``keys``, returning a dict of key to items.
+
+    ``backend`` is 'dict', 'sort', 'numpy' or 'auto', which uses NumPy for
+    arrays of 10,000 items or more (see the benchmark below) and a dict
+    otherwise. The NumPy backend returns arrays instead of lists.
+    """
+    if backend == 'auto':
+        large = len(items) >= 10_000
+        arrays = isinstance(keys, np.ndarray) and isinstance(items, np.ndarray)
+        backend = 'numpy' if large and arrays else 'dict'
+    return {'dict': group_dict, 'sort': group_sort,
+            'numpy': group_numpy}[backend](keys, items)
+
+group_by([word[0] for word in words], words)
+
+# %%
+# Let's compare the backends on random words, from 1e3 to 1e6 items. Add
+# 1e7 and 1e8 to ``sizes`` for larger inputs (1e8 words take several GB).
+# Keys are computed beforehand, as a list for the Python backends and as a
+# ``'U1'`` array for NumPy. Peak memory is measured with ``tracemalloc`` in a
+# separate run.
+
+import time
+import tracemalloc
+
+def measure(func, *args):
+    """Return the time of ``func(*args)`` and the peak memory it allocated."""
+    t0 = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+rng = np.random.default_rng(0)
+vocabulary = np.array(['apple', 'bat', 'bar', 'atom', 'book', 'cat', 'dog',
+                       'moon', 'sun', 'xylophone', 'yak', 'zebra'])
+sizes = [10**3, 10**4, 10**5, 10**6]
+for n in sizes:
+    word_array = rng.choice(vocabulary, n)
+    word_list = word_array.tolist()
+    inputs = {
+        'dict': ([word[0] for word in word_list], word_list),
+        'sort': ([word[0] for word in word_list], word_list),
+        'numpy': (word_array.astype('U1'), word_array),
+    }
+    for backend, (keys, items) in inputs.items():
+        elapsed, peak = measure(group_by, keys, items, backend)
+        print(f'{n:>8} items {backend:6} {n / elapsed / 1e6:6.2f} Mitems/s '
+              f'{peak / 2**20:7.2f} MB')
+
+# %%
+# The dict is hard to beat for Python lists, and its lists only hold
+# references to the existing strings, so it also uses the least memory.
+# Sorting in Python is much slower, but returns the groups in key order. NumPy
+# is faster when the data is already in arrays, although the sort inside
+# ``np.unique`` (O(n log n)) catches up with the dict loop (O(n)) for the
+# largest inputs, and the items are copied into each group.
+
 # %%
 # * **Tuple** immutable list. You can convert any sequence or iterator into a
 #   tuple.
@@ -262,3 +369,149 @@ print("Global:", locations)
 #   place.
 # * ``pop()`` removes the last element. If the new size is less than half the
 #   allocated size, then the list is shrunk.
+#
+# We can watch the over-allocation happen: ``sys.getsizeof`` returns the
+# size of the list object including its array of pointers, so it only changes
+# when the array is reallocated. Each pointer is 8 bytes on 64-bit builds.
+
+import sys
+
+def growth_events(n):
+    """Lengths at which appending reallocated, with the new capacity."""
+    events = []
+    lst = []
+    empty = sys.getsizeof(lst)
+    size = empty
+    for i in range(n):
+        lst.append(i)
+        new_size = sys.getsizeof(lst)
+        if new_size != size:
+            events.append((len(lst), (new_size - empty) // 8))
+            size = new_size
+    return events
+
+for length, capacity in growth_events(100):
+    print(f'len={length:3} capacity={capacity}')
+
+# %%
+# The capacity grows by ~1/8 of the list each time (plus a small constant),
+# so appends are amortised O(1). Popping shrinks the array once the list is
+# less than half full:
+
+def shrink_events(n):
+    """Lengths at which popping reallocated, with the new capacity."""
+    events = []
+    lst = list(range(n))
+    empty = sys.getsizeof([])
+    size = sys.getsizeof(lst)
+    while lst:
+        lst.pop()
+        new_size = sys.getsizeof(lst)
+        if new_size != size:
+            events.append((len(lst), (new_size - empty) // 8))
+            size = new_size
+    return events
+
+for length, capacity in shrink_events(100):
+    print(f'len={length:3} capacity={capacity}')
+
+# %%
+# Now let's time each operation on a list, a ``collections.deque`` (a doubly
+# linked list of blocks, O(1) at both ends) and an ``array.array``, which
+# stores the values themselves (here 8 byte floats) contiguously rather than
+# pointers to Python objects. Times are per operation, in nanoseconds,
+# growing to or shrinking from ``n`` elements.
+
+import timeit
+from array import array
+from collections import deque
+
+def operations(make, n):
+    """Functions growing to or shrinking from ``n`` elements a container
+    created by ``make()``."""
+    def fill_append():
+        c = make()
+        for i in range(n):
+            c.append(1.0)
+    def fill_insert():
+        c = make()
+        for i in range(n):
+            c.insert(0, 1.0)
+    full = make()
+    full.extend([1.0] * n)
+    def drain_pop():
+        c = make()
+        c.extend(full)
+        for i in range(n):
+            c.pop()
+    def drain_pop0():
+        c = make()
+        c.extend(full)
+        if isinstance(c, deque):
+            for i in range(n):
+                c.popleft()
+        else:
+            for i in range(n):
+                c.pop(0)
+    return {'append': fill_append, 'insert(0)': fill_insert,
+            'pop()': drain_pop, 'pop(0)': drain_pop0}
+
+def time_operations(n, repeat=5):
+    setups = {'list': list, 'deque': deque, 'array': lambda: array('d')}
+    ops = {name: operations(make, n) for name, make in setups.items()}
+    results = {name: dict.fromkeys(ops[name], float('inf'))
+               for name in setups}
+    # the structures take turns, so that they all see the same conditions
+    # (e.g., CPU frequency) on each repeat
+    for _ in range(repeat):
+        for name in setups:
+            for op, func in ops[name].items():
+                seconds = timeit.timeit(func, number=1)
+                results[name][op] = min(results[name][op], seconds / n * 1e9)
+    for name, make in setups.items():
+        full = make()
+        full.extend([1.0] * n)
+        results[name]['bytes/item'] = (sys.getsizeof(full)
+                                       - sys.getsizeof(make())) / n
+    return results
+
+for n in [1_000, 20_000]:
+    results = time_operations(n)
+    print(f'n={n}')
+    for name, timings in results.items():
+        print(f'  {name:6}', '  '.join(f'{op} {value:7.1f}'
+                                       for op, value in timings.items()))
+
+# %%
+# For the deque, ``pop(0)`` is timed with ``popleft()``. Note that the list
+# stores 8 byte pointers to float objects (another 24 bytes each, not
+# counted), while the array stores the 8 byte floats. Finally, list the
+# structures within 50% of the fastest for each access pattern, those using
+# the least memory first. The tolerance is wide because operations taking
+# tens of nanoseconds vary by 20-30% from one run to the next, which would
+# otherwise decide the order of structures that are really as fast:
+
+def suggest(results):
+    suggestions = {}
+    operations = [op for op in next(iter(results.values()))
+                  if op != 'bytes/item']
+    for op in operations:
+        fastest = min(results[name][op] for name in results)
+        close = [name for name in results
+                 if results[name][op] <= 1.5 * fastest]
+        suggestions[op] = sorted(
+            close, key=lambda name: results[name]['bytes/item'])
+    return suggestions
+
+suggest(results)
+
+# %%
+# In short: appending and popping from the end, a list and a ``deque`` are
+# equally fast. Which one is listed first only depends on where the blocks of
+# the ``deque`` happen to end, as both take about 8 bytes per item. A list
+# also gives O(1) indexing anywhere, which a ``deque`` does not, so it stays
+# the default. Adding or removing at the front, i.e. a queue, use a
+# ``deque``: the list and the array move every element each time. An
+# ``array.array`` is the slowest to append to, as every value is converted
+# from a Python float, and at best close to the others when popping, but it
+# saves the 24 bytes of each float object when storing many numbers.
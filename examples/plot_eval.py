@@ -96,6 +96,151 @@ exec(compile('42', '<string>', 'eval')) # returns 42 but ignored by exec
 
 eval(compile('a=2', '<string>', 'exec'))
 
+#%%
+# Caching code objects
+# ====================
+#
+# When the same snippets are evaluated over and over (e.g., rules in a rule
+# engine), we can keep the code objects in a dictionary keyed by the mode and
+# the source. Python caches the hash of a string, so looking up the same
+# string again is cheap. The cache below evicts the least recently used entry
+# when full (``OrderedDict`` remembers the order, ``move_to_end()`` marks an
+# entry as recently used) and counts hits and misses.
+#
+# Code objects can also be serialised with ``marshal`` (which is what ``.pyc``
+# files contain), so a restarted process can load them instead of compiling.
+# The ``marshal`` format changes between Python versions, so the file starts
+# with the bytecode 'magic number' of the interpreter that wrote it and is
+# ignored by any other version. Note that ``marshal.load(f)`` reads the file in
+# small pieces; reading it whole and using ``marshal.loads()`` is much faster.
+# A cache file that cannot be read (e.g., truncated) is ignored as well, and
+# ``save()`` writes a temporary file and renames it over the cache, so that a
+# crash while writing never leaves a corrupt cache behind.
+
+import importlib.util
+import marshal
+import os
+import tempfile
+from collections import OrderedDict
+
+class CodeCache:
+    """LRU cache of code objects, optionally persisted with ``marshal``."""
+
+    def __init__(self, maxsize=1024, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._codes = OrderedDict()
+        if path is not None:
+            self.load()
+
+    def compile(self, source, mode='eval'):
+        """Return the code object of ``source``, compiling it on a miss."""
+        key = (mode, source)
+        code = self._codes.get(key)
+        if code is None:
+            self.misses += 1
+            code = self._codes[key] = compile(source, '<cached>', mode)
+            if len(self._codes) > self.maxsize:
+                self._codes.popitem(last=False)
+        else:
+            self.hits += 1
+            self._codes.move_to_end(key)
+        return code
+
+    def __len__(self):
+        return len(self._codes)
+
+    def eval(self, source, namespace):
+        return eval(self.compile(source, 'eval'), namespace)
+
+    def exec(self, source, namespace):
+        exec(self.compile(source, 'exec'), namespace)
+
+    def save(self):
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path)))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(importlib.util.MAGIC_NUMBER)
+                f.write(marshal.dumps(list(self._codes.items())))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                if f.read(4) != importlib.util.MAGIC_NUMBER:
+                    return
+                codes = OrderedDict(marshal.loads(f.read()))
+        except (FileNotFoundError, EOFError, ValueError, TypeError):
+            return
+        self._codes.update(codes)
+        # keep the most recently used entries, saved last
+        while len(self._codes) > self.maxsize:
+            self._codes.popitem(last=False)
+
+#%%
+# Let's evaluate the same expression many times, from the string, through the
+# cache and from a code object compiled beforehand. The cache costs a method
+# call and a dictionary lookup per call, but avoids parsing and compiling:
+
+import timeit
+
+namespace = {'a': 3, 'b': 4}
+rule = 'a * 2 + b > 10'
+cache = CodeCache()
+code = compile(rule, '<string>', 'eval')
+number = 100_000
+for name, stmt in [('eval(str)', lambda: eval(rule, namespace)),
+                   ('CodeCache', lambda: cache.eval(rule, namespace)),
+                   ('eval(code)', lambda: eval(code, namespace))]:
+    seconds = min(timeit.repeat(stmt, number=number, repeat=3))
+    print(f'{name:10} {seconds / number * 1e9:6.0f} ns per call')
+print(f'hits={cache.hits} misses={cache.misses}')
+
+#%%
+# Persisting 1,000 rules and loading them into a new cache, as a restarted
+# process would:
+
+import time
+
+rules = [f'a * {i} + b > {i % 7}' for i in range(1000)]
+tmp_dir = tempfile.TemporaryDirectory()
+path = os.path.join(tmp_dir.name, 'rules.cache')
+cache = CodeCache(path=path)
+t0 = time.perf_counter()
+for r in rules:
+    cache.compile(r)
+print(f'compile: {time.perf_counter() - t0:.4f} s')
+cache.save()
+
+t0 = time.perf_counter()
+restarted = CodeCache(path=path)
+for r in rules:
+    restarted.compile(r)
+print(f'load:    {time.perf_counter() - t0:.4f} s, '
+      f'hits={restarted.hits} misses={restarted.misses}')
+
+#%%
+# A truncated cache file is ignored, and loading into a smaller cache keeps
+# only the most recently used entries:
+
+with open(path, 'r+b') as f:
+    f.truncate(100)
+print(f'truncated:  {len(CodeCache(path=path))} entries')
+cache.save()
+print(f'maxsize=10: {len(CodeCache(maxsize=10, path=path))} entries')
+tmp_dir.cleanup()
+
+#%%
+# Loading is several times faster than compiling, but a cached call is still
+# slower than calling ``eval()`` on a code object we hold on to. When the set
+# of snippets is known up front, compile them once and keep the code objects.
+
 #%%
 # *****
 # Trees
@@ -293,3 +438,98 @@ ast.Module(body=[
 #
 # `Blog tobiaskohn <https://tobiaskohn.ch/index.php/2018/07/30/transformations-in-python/>`_
 # goes through ast in Python well.
+
+#%%
+# Running blocks
+# ==============
+#
+# The same idea can run a whole series of code blocks (e.g., the cells of a
+# notebook or the blocks of this page) in one namespace, returning the value
+# of the last line of each block. Parsing and compiling are the expensive
+# part, so each block is split and compiled once: the runner keeps the pair of
+# code objects (statements to ``exec``, last expression to ``eval``) keyed by
+# the block source, and running an unchanged block again only executes them.
+
+class BlockRunner:
+    """Run code blocks in one namespace, returning their last expression."""
+
+    def __init__(self, namespace=None):
+        if namespace is None:
+            namespace = {'__name__': '__main__'}
+        self.namespace = namespace
+        self._codes = {}
+
+    def compile(self, source):
+        """Return the ``(exec_code, eval_code)`` pair of ``source``.
+
+        Either code object is ``None`` if there is nothing to run: no
+        statements before the last expression, or a last line that is not an
+        expression.
+        """
+        codes = self._codes.get(source)
+        if codes is None:
+            module = ast.parse(source, mode='exec')
+            last = None
+            if module.body and isinstance(module.body[-1], ast.Expr):
+                last = compile(ast.Expression(module.body.pop().value),
+                               '<block>', 'eval')
+            body = compile(module, '<block>', 'exec') if module.body else None
+            codes = self._codes[source] = (body, last)
+        return codes
+
+    def run(self, source):
+        """Run ``source`` and return the value of its last line, if any."""
+        body, last = self.compile(source)
+        if body is not None:
+            exec(body, self.namespace)
+        if last is not None:
+            return eval(last, self.namespace)
+
+#%%
+# Values and names carry over from one block to the next:
+
+runner = BlockRunner()
+runner.run('import math\nr = 2')
+runner.run('area = math.pi * r ** 2\narea')
+
+#%%
+# Let's compare running a few small blocks with a plain ``exec()`` of their
+# source (which compiles every time and returns nothing), with splitting and
+# compiling them every time, and with a runner that is reused, as a notebook
+# kernel would be:
+
+blocks = [
+    'x = list(range(10))\nsum(x)',
+    'y = [i ** 2 for i in x]\nmax(y)',
+    'def f(n):\n    return n * 2\nf(21)',
+    'for i in range(3):\n    x.append(i)',
+    'len(x)',
+]
+
+def run_naive(blocks, namespace):
+    for source in blocks:
+        exec(source, namespace)
+
+def run_uncached(blocks, namespace):
+    for source in blocks:
+        BlockRunner(namespace).run(source)
+
+def run_cached(blocks, runner):
+    for source in blocks:
+        runner.run(source)
+
+runner = BlockRunner()
+number = 2_000
+for name, stmt in [('exec(str)', lambda: run_naive(blocks, {})),
+                   ('split, uncached', lambda: run_uncached(blocks, {})),
+                   ('BlockRunner', lambda: run_cached(blocks, runner))]:
+    seconds = min(timeit.repeat(stmt, number=number, repeat=3))
+    per_block = seconds / number / len(blocks)
+    print(f'{name:16} {per_block * 1e6:6.1f} us per block')
+
+#%%
+# Splitting without caching is slower than ``exec()`` of the string: the
+# source is parsed into Python ``ast`` objects, which ``compile()`` then has to
+# convert back, whereas ``exec()`` of a string never leaves C. Once compiled,
+# a block only costs running its code objects, more than ten times less than
+# ``exec()`` of the source.
@@ -161,4 +161,487 @@ nums_squared_lc
 # %%
 # With the list, you build and hold the entire object in memory but with
 # generator, there is no memory penalty. However, list comprehensions can
-# be faster to evaluate than correspondig generator expression.-
\ No newline at end of file
+# be faster to evaluate than correspondig generator expression.-
+#
+# Reading large files in blocks
+# =============================
+#
+# ``csv_reader`` above reads one line per iteration. Python buffers the file
+# underneath, but every line is still decoded and turned into a new ``str``.
+# For multi-GB files we can instead read large blocks of bytes and split them
+# into rows ourselves. Memory stays constant as only one block is held at a
+# time, whatever the size of the file.
+#
+# A block usually ends part way through a line, the partial line is kept and
+# put in front of the next block:
+
+def csv_blocks(file_name, block_size=2**20):
+    """Yield blocks of whole lines (bytes), reading ``block_size`` at a time."""
+    with open(file_name, 'rb') as f:
+        rest = b''
+        for block in iter(lambda: f.read(block_size), b''):
+            end = block.rfind(b'\n') + 1
+            if end == 0:
+                # line longer than the block
+                rest += block
+                continue
+            yield rest + block[:end] if rest else memoryview(block)[:end]
+            rest = block[end:]
+        if rest:
+            yield rest
+
+# %%
+# Rows are then split out of each block by ``bytes.split``, which runs in C.
+# This copies each row once into a small ``bytes`` object but skips decoding
+# to ``str``. (Yielding ``memoryview`` slices of the block avoids the copy,
+# but creating a ``memoryview`` costs more than copying a short row, so it
+# only pays off for very long rows.)
+
+def csv_rows(file_name, block_size=2**20):
+    """Like ``csv_reader`` but yields each row as ``bytes``, without the line
+    break."""
+    for block in csv_blocks(file_name, block_size):
+        rows = bytes(block).split(b'\n')
+        if not rows[-1]:
+            # the block ended with a line break
+            rows.pop()
+        yield from rows
+
+# %%
+# For numeric data we can skip Python level rows entirely. Parsing each block
+# into floats with NumPy (``np.loadtxt``, or splitting the block and
+# converting the ``bytes`` with ``astype(float)``) turns out to be slower than
+# ``float()`` on each row, so the parsing is left to the C parser of pandas:
+# with ``chunksize``, ``pd.read_csv`` returns an iterator of DataFrames with
+# that many rows each, reading the file one block at a time. The batches are
+# yielded as plain arrays, one per column:
+
+import numpy as np
+import pandas as pd
+
+def csv_batches(file_name, batch_size=10_000, dtype=float):
+    """Yield dicts of column name to 1D array, ``batch_size`` rows each.
+
+    The first row of the file must be the header. The last batch may be
+    shorter. An empty file yields nothing.
+    """
+    try:
+        reader = pd.read_csv(file_name, chunksize=batch_size, dtype=dtype)
+    except pd.errors.EmptyDataError:
+        return
+    with reader:
+        for chunk in reader:
+            yield {name: column.to_numpy() for name, column in chunk.items()}
+
+# %%
+# Let's compare them with the line by line ``csv_reader`` and reading the
+# whole file with ``pd.read_csv``. Each reads a numeric csv file and sums
+# the first column; the time is the best of 3 runs. Peak memory is measured
+# in a separate run, as ``tracemalloc`` slows down every allocation. Note that the memory of the
+# blocked readers does not grow with the file size.
+
+import os
+import tempfile
+import time
+import tracemalloc
+
+def csv_reader(file_name):
+    for row in open(file_name, "r"):
+        yield row
+
+def sum_lines(file_name):
+    lines = csv_reader(file_name)
+    next(lines)
+    return sum(float(line.split(',', 1)[0]) for line in lines)
+
+def sum_rows(file_name):
+    rows = csv_rows(file_name)
+    next(rows)
+    return sum(float(row.split(b',', 1)[0]) for row in rows)
+
+def sum_batches(file_name):
+    return sum(batch['a'].sum() for batch in csv_batches(file_name))
+
+def sum_pandas(file_name):
+    return pd.read_csv(file_name)['a'].sum()
+
+# removed once the last example using its files has run
+tmp_dir = tempfile.TemporaryDirectory()
+for n_rows in [10**5, 3 * 10**5]:
+    file_name = os.path.join(tmp_dir.name, f'data_{n_rows}.csv')
+    data = pd.DataFrame(np.random.rand(n_rows, 4), columns=list('abcd'))
+    data.to_csv(file_name, index=False)
+    for reader in [sum_lines, sum_rows, sum_batches, sum_pandas]:
+        elapsed = float('inf')
+        for _ in range(3):
+            t0 = time.perf_counter()
+            reader(file_name)
+            elapsed = min(elapsed, time.perf_counter() - t0)
+        tracemalloc.start()
+        reader(file_name)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f'{n_rows:>6} rows {reader.__name__:12} {elapsed * 1e3:7.1f} ms '
+              f'peak {peak / 2**20:5.1f} MB')
+
+# %%
+# None of the readers is clearly faster: the times are within the noise of
+# each other, and which one comes first changes from run to run. The line by
+# line ``csv_reader`` keeps up because it only converts the first field of
+# each row, while ``csv_batches`` and ``pd.read_csv`` parse every column.
+# Reading by blocks does not make the row readers faster either, since most
+# of the time goes into the Python level work on each row. What differs is
+# memory: ``pd.read_csv`` holds the whole file, so its peak grows with the
+# file, while the peak of ``csv_batches`` stays at one batch. Use the batches
+# when every column is needed as arrays and the file may not fit in memory.
+
+# %%
+# Asynchronous generators
+# =======================
+#
+# Ref: `PEP 525 <https://peps.python.org/pep-0525/>`_
+#
+# When the values come from I/O (network, slow disks, other processes), a
+# generator spends most of its time waiting, and nothing else runs in the
+# meantime. An ``async def`` function containing ``yield`` is an *asynchronous
+# generator*: it is iterated with ``async for`` (or ``await anext()``) and can
+# ``await`` between values, letting the event loop run other tasks while it
+# waits. Coroutines only run inside an event loop, started here by
+# ``asyncio.run()``.
+
+import asyncio
+
+async def ainfinite_sequence():
+    num = 0
+    while True:
+        yield num
+        num += 1
+
+async def take(agen, n):
+    return [await anext(agen) for _ in range(n)]
+
+asyncio.run(take(ainfinite_sequence(), 5))
+
+# %%
+# ``yield from`` is not allowed in asynchronous generators, so composing them
+# goes back to the explicit loops:
+
+async def agenerator2():
+    for i in range(10):
+        yield i
+
+async def agenerator3():
+    for j in range(10, 20):
+        yield j
+
+async def agenerator():
+    async for i in agenerator2():
+        yield i
+    async for j in agenerator3():
+        yield j
+
+async def collect(agen):
+    return [value async for value in agen]
+
+asyncio.run(collect(agenerator()))
+
+# %%
+# File reads block the thread and there is no asynchronous file API in the
+# standard library. ``asyncio.to_thread()`` runs a blocking call in a worker
+# thread, so the event loop stays free while the next block of the file is
+# read. Reading by blocks (with ``csv_blocks`` from above) rather than by
+# line keeps the number of thread hand offs small:
+
+async def acsv_reader(file_name, block_size=2**20):
+    blocks = csv_blocks(file_name, block_size)
+    while (block := await asyncio.to_thread(next, blocks, None)) is not None:
+        rows = bytes(block).split(b'\n')
+        if not rows[-1]:
+            rows.pop()
+        for row in rows:
+            yield row
+
+async def count_rows(file_name):
+    return sum([1 async for _ in acsv_reader(file_name)])
+
+asyncio.run(count_rows(file_name))
+
+# %%
+
+tmp_dir.cleanup()
+
+# %%
+# Backpressure and fan in
+# -----------------------
+#
+# A consumer pulling from an asynchronous generator still waits for each
+# value in turn. To let the source read ahead while the consumer works, run
+# the source in its own task, feeding a queue. Bounding the queue gives
+# *backpressure*: once ``maxsize`` values are waiting, ``put()`` suspends the
+# source until the consumer catches up, so a fast source cannot fill the
+# memory.
+#
+# The same queue can be fed by several sources at once (*fan in*), yielding
+# values in the order they arrive. The producer tasks are cancelled if the
+# consumer stops early, and an exception raised by a source is raised again
+# in the consumer.
+#
+# Each producer signals the end of its source with a sentinel, sent only when
+# the source ends by itself. Sending it in a ``finally`` clause would also run
+# on cancellation, and block forever if the queue is full as nobody reads it
+# anymore.
+
+_DONE = object()
+
+class _SourceError:
+    def __init__(self, exc):
+        self.exc = exc
+
+async def merge(*sources, maxsize=16):
+    """Iterate over the async iterables `sources` concurrently."""
+    queue = asyncio.Queue(maxsize)
+
+    async def produce(source):
+        try:
+            async for value in source:
+                await queue.put(value)
+        except Exception as exc:
+            await queue.put(_SourceError(exc))
+        else:
+            await queue.put(_DONE)
+
+    tasks = [asyncio.create_task(produce(source)) for source in sources]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            value = await queue.get()
+            if value is _DONE:
+                remaining -= 1
+            elif isinstance(value, _SourceError):
+                raise value.exc
+            else:
+                yield value
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def buffered(source, maxsize=16):
+    """Read ahead from one async iterable, in a task of its own."""
+    return merge(source, maxsize=maxsize)
+
+# %%
+# Let's simulate a source with some latency per value (e.g., a network
+# request per record), in a synchronous and an asynchronous version, and
+# a consumer that also takes some time per value. Synchronously, the
+# latencies of the sources and the consumer add up. Asynchronously, the
+# consumer works while the next value is fetched, and the four sources wait
+# at the same time:
+
+def slow_source(n, latency):
+    for i in range(n):
+        time.sleep(latency)
+        yield i
+
+async def aslow_source(n, latency):
+    for i in range(n):
+        await asyncio.sleep(latency)
+        yield i
+
+n_sources, n_values, latency, work = 4, 25, 0.004, 0.002
+
+async def achain(*sources):
+    for source in sources:
+        async for value in source:
+            yield value
+
+def run_sync():
+    sources = [slow_source(n_values, latency) for _ in range(n_sources)]
+    for _ in chain(*sources):
+        time.sleep(work)
+
+async def run_async(concurrent):
+    sources = [aslow_source(n_values, latency) for _ in range(n_sources)]
+    if concurrent:
+        values = merge(*sources)
+    else:
+        values = buffered(achain(*sources))
+    async for _ in values:
+        await asyncio.sleep(work)
+
+n_total = n_sources * n_values
+for name, run in [('sync chain', run_sync),
+                  ('async buffered', lambda: asyncio.run(run_async(False))),
+                  ('async merge', lambda: asyncio.run(run_async(True)))]:
+    t0 = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - t0
+    print(f'{name:15} {elapsed:5.2f} s, {n_total / elapsed:6.0f} values/s')
+
+# %%
+# Reading ahead overlaps the consumer with one source, so each value costs
+# the larger of the two latencies instead of their sum. Fanning in overlaps
+# the sources with each other as well, and the consumer becomes the
+# bottleneck. This only helps when the time is spent waiting: CPU bound work
+# in a coroutine blocks the event loop like any other code.
+
+# %%
+# Measuring the idioms
+# ====================
+#
+# The differences between the idioms above are small, so a single timing is
+# easily swamped by noise (other processes, CPU frequency changes, garbage
+# collection). To compare them reliably, each measurement below:
+#
+# * warms up first (e.g., for allocator pools to fill up),
+# * times many samples, each one calibrated to run for a few milliseconds,
+# * rejects outliers - samples more than 1.5 inter-quartile ranges beyond the
+#   quartiles (usually interrupted runs),
+# * reports the median with a 95% confidence interval, obtained by
+#   bootstrapping: resampling the samples many times and taking the spread of
+#   the resampled medians,
+# * measures the peak memory with ``tracemalloc`` in a separate run.
+#
+# The idioms are written to take the input size ``n``. The generators are
+# exhausted with a ``deque`` of length 0, which consumes an iterator in C, so
+# that the loop consuming them is not timed.
+
+import json
+import platform
+import statistics
+from collections import deque
+
+def nested_for(n):
+    for i in range(n):
+        yield i
+    for j in range(n, 2 * n):
+        yield j
+
+def first_half(n):
+    for i in range(n):
+        yield i
+
+def second_half(n):
+    for j in range(n, 2 * n):
+        yield j
+
+def for_over_generators(n):
+    for i in first_half(n):
+        yield i
+    for j in second_half(n):
+        yield j
+
+def yield_from(n):
+    yield from first_half(n)
+    yield from second_half(n)
+
+def chained(n):
+    for v in chain(first_half(n), second_half(n)):
+        yield v
+
+idioms = {
+    'nested for': lambda n: deque(nested_for(n), maxlen=0),
+    'for over generators': lambda n: deque(for_over_generators(n), maxlen=0),
+    'yield from': lambda n: deque(yield_from(n), maxlen=0),
+    'chain': lambda n: deque(chained(n), maxlen=0),
+    'generator expression': lambda n: sum(num**2 for num in range(n)),
+    'list comprehension': lambda n: sum([num**2 for num in range(n)]),
+}
+
+def calibrate(func, n, target=0.002):
+    """Number of calls of ``func(n)`` taking at least ``target`` seconds."""
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func(n)
+        if time.perf_counter() - t0 >= target:
+            return number
+        number *= 2
+
+def reject_outliers(samples):
+    q1, _, q3 = statistics.quantiles(samples, n=4)
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    return [s for s in samples if low <= s <= high]
+
+def bootstrap_ci(samples, n_resamples=1000, seed=0):
+    """95% confidence interval of the median of `samples`."""
+    rng = np.random.default_rng(seed)
+    resampled = rng.choice(samples, size=(n_resamples, len(samples)))
+    return np.percentile(np.median(resampled, axis=1), [2.5, 97.5]).tolist()
+
+def measure(func, n, warmup=3, repeats=20):
+    number = calibrate(func, n)
+    for _ in range(warmup):
+        func(n)
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func(n)
+        samples.append((time.perf_counter() - t0) / number)
+    kept = reject_outliers(samples)
+    tracemalloc.start()
+    func(n)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'median': statistics.median(kept), 'ci95': bootstrap_ci(kept),
+            'n_samples': len(kept), 'n_outliers': len(samples) - len(kept),
+            'number': number, 'peak_memory': peak}
+
+results = {
+    'python': platform.python_version(),
+    'implementation': platform.python_implementation(),
+    'machine': platform.machine(),
+    'results': {name: {n: measure(func, n) for n in [100, 10_000]}
+                for name, func in idioms.items()},
+}
+
+# %%
+# The results are saved as JSON, one file per Python version, in the
+# directory given by the environment variable ``ITER_BENCH_DIR`` (by default
+# ``iter_bench`` in the temporary directory of the system, which is kept
+# between runs). Running this page with several Python versions collects
+# their results to compare, each run replacing the file of its version:
+
+bench_dir = os.environ.get(
+    'ITER_BENCH_DIR', os.path.join(tempfile.gettempdir(), 'iter_bench'))
+os.makedirs(bench_dir, exist_ok=True)
+bench_file = os.path.join(bench_dir, f'iter_{results["python"]}.json')
+with open(bench_file, 'w') as f:
+    json.dump(results, f, indent=1)
+
+table = pd.DataFrame([
+    {'idiom': name, 'n': n, 'median (us)': r['median'] * 1e6,
+     'ci95 (us)': '{:.1f} - {:.1f}'.format(*np.multiply(r['ci95'], 1e6)),
+     'outliers': r['n_outliers'], 'peak (kB)': r['peak_memory'] / 1e3}
+    for name, by_size in results['results'].items()
+    for n, r in by_size.items()
+])
+table.round(1)
+
+# %%
+# To compare the medians of every saved Python version (JSON turns the sizes
+# into strings):
+
+def load_results(bench_dir):
+    runs = {}
+    for name in sorted(os.listdir(bench_dir)):
+        if name.startswith('iter_') and name.endswith('.json'):
+            with open(os.path.join(bench_dir, name)) as f:
+                run = json.load(f)
+            runs[run['python']] = {(idiom, int(n)): r['median'] * 1e6
+                                   for idiom, by_size in run['results'].items()
+                                   for n, r in by_size.items()}
+    return pd.DataFrame(runs).rename_axis(['idiom', 'n'])
+
+load_results(bench_dir).round(1)
+
+# %%
+# Splitting the generator in two costs much more than any of the ways of
+# combining the halves: every value now passes through two generators. The
+# intervals of ``yield from``, the loops over the generators and ``chain``
+# mostly overlap, so none of them is reliably faster and the choice is one of
+# readability. The list comprehension is faster than the generator
+# expression, which resumes a generator for every value, but its memory grows
+# with ``n`` while that of the generator expression stays constant.
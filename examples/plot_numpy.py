@@ -56,7 +56,8 @@ A
 
 #%%
 # In the above case, there was already an array of size '9', so numpy reuses
-# the data saved in this memory.
+# the data saved in this memory. (See 'Reusing buffers' below to do this
+# deliberately.)
 
 #%%
 #  You can also use ``np.arange``:
@@ -106,15 +107,16 @@ np.array([1,2,3,4])
 np.array([[1,2],[3,4]])
 
 #%%
-# What happens here?
+# What happens here? Lists of different lengths do not make a 2D array. Since
+# NumPy 1.24 this raises a ``ValueError`` unless ``dtype=object`` is passed:
 
-np.array([[1,2],[3,4,5]])
+np.array([[1,2],[3,4,5]], dtype=object)
 
 #%%
-# Note that the ``dytpe=object``. This means ANY Python object and is difficult
+# Note that the ``dtype=object``. This means ANY Python object and is difficult
 # to work with. Here the numpy array is made of lists, it is of shape:
 
-np.array([[1,2],[3,4,5]]).shape
+np.array([[1,2],[3,4,5]], dtype=object).shape
 
 #%%
 # Numpy array object
@@ -177,15 +179,182 @@ a[:1].shape
 #   you wish to keep the dimension you can do ``i:i+1`` instead.
 # * If there is more than one non ``:`` entry, it acts like repeated
 #   application of slicing. ``x[ind1,...,ind2,:]`` = ``x[ind1][...,ind2,:]
+
+# %%
+# Strided views
+# -------------
+#
+# A view is described by its ``strides``: the number of bytes to step in
+# memory to move one element along each axis. Since views never copy, any
+# layout that can be described by a shape and strides over the same buffer is
+# free, even when elements appear several times (e.g., overlapping windows).
+# ``np.lib.stride_tricks.as_strided`` builds such views; it does not check
+# that they stay inside the buffer, so the helpers below compute the shape and
+# strides themselves and return read-only views, as writing through
+# overlapping elements is rarely what we want.
+
+from numpy.lib.stride_tricks import as_strided
+
+def sliding_windows(x, window, step=1):
+    """View of the windows of length ``window`` along the last axis of ``x``,
+    every ``step`` elements. The windows are a new last axis."""
+    n = (x.shape[-1] - window) // step + 1
+    if n <= 0:
+        raise ValueError(f'window {window} longer than the axis')
+    shape = x.shape[:-1] + (n, window)
+    strides = x.strides[:-1] + (x.strides[-1] * step, x.strides[-1])
+    return as_strided(x, shape, strides, writeable=False)
+
+def block_view(x, block_shape):
+    """View of ``x`` as a grid of non overlapping blocks.
+
+    A 2D ``x`` of shape ``(6, 4)`` with blocks of ``(3, 2)`` gives shape
+    ``(2, 2, 3, 2)``: block ``[i, j]`` is ``x[3*i:3*i+3, 2*j:2*j+2]``. Rows or
+    columns left over at the end are dropped.
+    """
+    grid = tuple(n // b for n, b in zip(x.shape, block_shape))
+    strides = (tuple(s * b for s, b in zip(x.strides, block_shape))
+               + x.strides)
+    return as_strided(x, grid + tuple(block_shape), strides, writeable=False)
+
+def reshape_view(x, shape):
+    """Like ``x.reshape(shape)``, but raise ``ValueError`` rather than copy."""
+    return np.reshape(x, shape, copy=False)
+
+def subsample(x, *steps):
+    """Every ``steps[i]``-th element along axis ``i``, as a view."""
+    return x[tuple(slice(None, None, step) for step in steps)]
+
+x = np.arange(10)
+sliding_windows(x, 4, step=2)
+
+# %%
+# ``block_view`` followed by a reduction over the last axes gives, e.g.,
+# pooling of an image without copying it into blocks first:
+
+image = np.arange(24).reshape(4, 6)
+block_view(image, (2, 3)).max(axis=(2, 3))
+
+# %%
+# ``reshape()`` quietly copies when the strides cannot describe the new
+# shape, for instance after transposing; ``reshape_view`` makes the copy
+# visible:
+
+try:
+    reshape_view(image.T, 24)
+except ValueError as e:
+    print(e)
+
+# %%
+# Auditing copies
+# ---------------
+#
+# To find out where a function copies, we can trace it line by line with
+# ``sys.settrace``. After every line, each array bound to a local variable
+# for the first time is checked with ``np.shares_memory`` against the inputs
+# and the arrays seen so far: if it shares memory with none of them, the line
+# allocated a new buffer. ``tracemalloc`` additionally gives the peak memory
+# allocated while the line ran, which includes temporaries never bound to a
+# name. (The audit keeps every array it has seen alive, so only use it on
+# small inputs.)
+
+import linecache
+import sys
+import tracemalloc
+
+def audit_copies(func, *args, **kwargs):
+    """Run ``func`` and return, for each line executed, the arrays it bound
+    (name, bytes, whether it is a new buffer) and the bytes it allocated."""
+    code = func.__code__
+    seen = [arg for arg in (*args, *kwargs.values())
+            if isinstance(arg, np.ndarray)]
+    bound = {}
+    report = []
+    state = {'line': None}
+
+    def end_line(frame):
+        current, peak = tracemalloc.get_traced_memory()
+        arrays = []
+        for name, value in frame.f_locals.items():
+            if not isinstance(value, np.ndarray) or bound.get(name) is value:
+                continue
+            bound[name] = value
+            new = not any(np.shares_memory(value, s) for s in seen)
+            seen.append(value)
+            arrays.append((name, value.nbytes, new))
+        source = linecache.getline(code.co_filename, state['line']).strip()
+        report.append((state['line'], source, arrays,
+                       peak - state['start']))
+
+    def trace(frame, event, arg):
+        if frame.f_code is not code:
+            return None
+        if event in ('line', 'return'):
+            if state['line'] is not None:
+                end_line(frame)
+            state['line'] = frame.f_lineno
+            tracemalloc.reset_peak()
+            state['start'] = tracemalloc.get_traced_memory()[0]
+        return trace
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    # put back any tracer already running (a debugger, coverage)
+    previous = sys.gettrace()
+    sys.settrace(trace)
+    try:
+        func(*args, **kwargs)
+    finally:
+        sys.settrace(previous)
+        if not tracing:
+            tracemalloc.stop()
+    return report
+
+def print_audit(report):
+    for lineno, source, arrays, allocated in report:
+        copies = ', '.join(f'{name} {nbytes / 1e3:.0f} kB'
+                           for name, nbytes, new in arrays if new)
+        print(f'{lineno:4} {allocated / 1e3:8.0f} kB  {source[:40]:40} '
+              f'{"new: " + copies if copies else ""}')
+
+# %%
+# Let's audit a rolling feature computed the obvious way, by stacking slices
+# into a 2D array and reducing it, against the same feature computed on the
+# windows view:
+
+def rolling_features(x, window):
+    windows = np.array([x[i:i + window] for i in range(len(x) - window + 1)])
+    centred = windows - windows.mean(axis=1, keepdims=True)
+    return centred.std(axis=1)
+
+def rolling_features_view(x, window):
+    windows = sliding_windows(x, window)
+    mean = windows.mean(axis=1, keepdims=True)
+    return np.sqrt(((windows - mean) ** 2).mean(axis=1))
+
+signal = np.random.default_rng(0).standard_normal(10_000)
+np.testing.assert_allclose(rolling_features(signal, 50),
+                           rolling_features_view(signal, 50))
+print_audit(audit_copies(rolling_features, signal, 50))
+print()
+print_audit(audit_copies(rolling_features_view, signal, 50))
+
+# %%
+# The first version copies every window into ``windows`` (50x the size of the
+# signal). The view only needs the temporaries of the arithmetic, which are
+# still as large as the windows, as ``windows - mean`` broadcasts to their
+# shape. Computing the variance as ``E[x^2] - E[x]^2`` from cumulative sums
+# would avoid these too, at the cost of some precision.
 #
 # NaNs
 # ====
 #
 # NaN = result of calculation that does not have a sensible numerical answer.
-# Also commonly used for missing data. ``NaN``s compare as different to
-# everything, including other ``NaN``s.
+# Also commonly used for missing data. ``NaN``\ s compare as different to
+# everything, including other ``NaN``\ s.
 
-np.NaN != np.NaN
+np.nan != np.nan
 
 # %%
 # Reasoning, you generally cannot say that ``NaN`` producing calculations
@@ -197,7 +366,7 @@ np.sqrt(-1) == (np.inf - np.inf)
 # %%
 # You can have -ve ``NaN`` - it is a bit pattern and the sign bit can be
 # -ve or +ve. There is also a 'quiet' signalling bit - if set, CPU sets flag
-# that raises exception. Quiet ``NaN``s propagate along quietly.
+# that raises exception. Quiet ``NaN``\ s propagate along quietly.
 #
 # Memory usage
 # ============
@@ -206,9 +375,9 @@ np.sqrt(-1) == (np.inf - np.inf)
 # For example:
 
 size = [100]
-a = np.ones(size, dytpe=np.float32)
-b = np.full(size, 5.0, dytpe=np.float32)
-c = np.full(size, np.pi, dytpe=np.float32)
+a = np.ones(size, dtype=np.float32)
+b = np.full(size, 5.0, dtype=np.float32)
+c = np.full(size, np.pi, dtype=np.float32)
 output = np.add(a, np.multiply(b, c))
 
 # %%
@@ -223,4 +392,452 @@ output = np.add(a, np.multiply(b, c))
 # Movement between CPU and memory, impossible to avoid. Cython or Numba
 # can loop over individual values and put things straight into ``output``.
 #
-# C and Fortran perform better in this regard.
\ No newline at end of file
+# C and Fortran perform better in this regard.
+#
+# Blocked evaluation
+# ------------------
+#
+# We can get close to this with NumPy alone. Instead of evaluating the whole
+# expression at once, evaluate it on blocks that fit in the CPU cache and
+# write each block straight into a preallocated ``output``. Temporaries are
+# now block sized, so peak memory is ~4x the array size (``a``, ``b``, ``c``
+# and ``output``). Each block of ``b * c`` is also still in cache when it is
+# added to ``a``, instead of going out to memory and back.
+#
+# The expression is any function of the input blocks:
+
+def evaluate_blocked(expr, *arrays, out, block=2**15):
+    """Evaluate ``expr(*arrays)`` into ``out``, ``block`` elements at a time.
+
+    All arrays must be 1D and the same length as ``out``. The default block
+    is 128 KB of float32, which fits in L2 cache.
+    """
+    for start in range(0, out.shape[0], block):
+        chunk = slice(start, start + block)
+        out[chunk] = expr(*(x[chunk] for x in arrays))
+    return out
+
+output = np.empty_like(a)
+evaluate_blocked(lambda a, b, c: a + b * c, a, b, c, out=output)
+
+# %%
+# Let's compare it with the plain expression, and with passing ``out=`` to
+# each ufunc, which also avoids the temporaries but makes two full passes over
+# memory. ``tracemalloc`` tracks NumPy allocations, so it gives the memory
+# allocated on top of the arrays we already hold: ``a``, ``b``, ``c`` and, if
+# it is written into, ``output``.
+#
+# Arrays up to 1e7 elements are used here to keep the docs build quick; add
+# 1e8 and 1e9 to ``sizes`` to benchmark larger arrays (the 4 float32 arrays
+# then take 1.6 and 16 GB).
+
+import timeit
+import tracemalloc
+
+def peak_and_time(func):
+    """Return peak memory allocated by ``func()`` and its best time (ms)."""
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    best = min(timeit.repeat(func, number=3, repeat=3)) / 3
+    return peak, best * 1e3
+
+sizes = [10**5, 10**6, 10**7]
+methods = {
+    'plain': lambda: np.add(a, np.multiply(b, c)),
+    'out=': lambda: np.add(a, np.multiply(b, c, out=output), out=output),
+    'blocked': lambda: evaluate_blocked(lambda a, b, c: a + b * c,
+                                        a, b, c, out=output),
+}
+for n in sizes:
+    a = np.ones(n, dtype=np.float32)
+    b = np.full(n, 5.0, dtype=np.float32)
+    c = np.full(n, np.pi, dtype=np.float32)
+    output = np.empty_like(a)
+    for name, func in methods.items():
+        peak, ms = peak_and_time(func)
+        held = 3 if name == 'plain' else 4
+        print(f'n={n:.0e} {name:8} peak={held + peak / a.nbytes:.2f}x '
+              f'time={ms:.2f} ms')
+
+# %%
+# For anything more complex, `numexpr <https://github.com/pydata/numexpr>`_
+# does the same blocking (and uses multiple threads) from an expression
+# string.
+
+# %%
+# Planning memory
+# ---------------
+#
+# Before running a large job, we can predict its peak memory without
+# allocating anything. Describe the expression as a tree over named inputs
+# with their shapes and dtypes, then walk the tree in the order NumPy
+# evaluates it (operands left to right, then the operation):
+#
+# * the shape of each result follows the broadcasting rules above
+#   (``np.broadcast_shapes``) and its dtype the type promotion rules of the
+#   ufunc (``ufunc.resolve_dtypes``),
+# * every operation allocates a temporary for its result; temporaries are
+#   freed as soon as the operation using them finishes,
+# * the inputs are held throughout.
+#
+# The peak is the largest total of inputs plus live temporaries. The planner
+# also suggests a rewrite with ``out=``: an operation can write into the
+# temporary of one of its operands, as long as that temporary has the shape
+# and dtype of the result (it is not broadcast up, or cast).
+
+class Expr:
+    def __add__(self, other):
+        return Op(np.add, self, other)
+
+    def __radd__(self, other):
+        return Op(np.add, other, self)
+
+    def __sub__(self, other):
+        return Op(np.subtract, self, other)
+
+    def __rsub__(self, other):
+        return Op(np.subtract, other, self)
+
+    def __mul__(self, other):
+        return Op(np.multiply, self, other)
+
+    def __rmul__(self, other):
+        return Op(np.multiply, other, self)
+
+    def __truediv__(self, other):
+        return Op(np.true_divide, self, other)
+
+    def __rtruediv__(self, other):
+        return Op(np.true_divide, other, self)
+
+    def __pow__(self, other):
+        return Op(np.power, self, other)
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+
+class Input(Expr):
+    """A named input array, described by its shape and dtype."""
+
+    def __init__(self, name, shape, dtype=np.float64):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    def __repr__(self):
+        return self.name
+
+
+class Op(Expr):
+    """A ufunc applied to expressions or Python scalars."""
+
+    def __init__(self, ufunc, *args):
+        self.ufunc = ufunc
+        self.args = args
+        shapes = [getattr(arg, 'shape', ()) for arg in args]
+        dtypes = [getattr(arg, 'dtype', type(arg)) for arg in args]
+        self.shape = np.broadcast_shapes(*shapes)
+        self.dtype = ufunc.resolve_dtypes((*dtypes, None))[-1]
+
+    def __repr__(self):
+        return f'np.{self.ufunc.__name__}({", ".join(map(repr, self.args))})'
+
+# %%
+# The planner returns the predicted peak in bytes, the temporaries
+# allocated, and the lines of a rewrite using ``out=`` (with the name of the
+# buffer holding the result):
+
+def plan_memory(expr):
+    """Predict the peak memory of evaluating ``expr`` with NumPy."""
+    inputs = {}
+    temporaries = []
+    lines = []
+    peak = [0, 0]  # plain, with out=
+
+    def visit(node, live):
+        """Evaluate ``node`` on top of ``live`` bytes of temporaries.
+
+        Returns the name of the buffer holding the result and whether it is
+        a temporary.
+        """
+        if isinstance(node, Input):
+            inputs[node.name] = node.nbytes
+            return node.name, False
+        if not isinstance(node, Op):
+            return repr(node), False
+        held = [0, 0]
+        names = []
+        reusable = None
+        for arg in node.args:
+            name, is_temp = visit(arg, [l + h for l, h in zip(live, held)])
+            names.append(name)
+            if is_temp:
+                # the temporary stays alive while the next operands are
+                # evaluated, even if the result is then written into it
+                held[0] += arg.nbytes
+                held[1] += arg.nbytes
+                if (reusable is None and arg.shape == node.shape
+                        and arg.dtype == node.dtype):
+                    reusable = name
+        # the result is allocated while the operands are still alive
+        peak[0] = max(peak[0], live[0] + held[0] + node.nbytes)
+        peak[1] = max(peak[1], live[1] + held[1]
+                      + (0 if reusable else node.nbytes))
+        temporaries.append((repr(node), node.nbytes))
+        out = reusable or f't{len(temporaries)}'
+        call = f'np.{node.ufunc.__name__}({", ".join(names)}'
+        if reusable:
+            lines.append(f'{call}, out={out})')
+        else:
+            lines.append(f'{out} = {call})')
+        return out, True
+
+    result, _ = visit(expr, [0, 0])
+    input_bytes = sum(inputs.values())
+    return {'shape': expr.shape, 'dtype': expr.dtype, 'result': result,
+            'inputs': input_bytes, 'temporaries': temporaries,
+            'peak': input_bytes + peak[0], 'peak_out': input_bytes + peak[1],
+            'rewrite': lines}
+
+# %%
+# For example, normalising a batch of images: each channel is centred and
+# scaled by a per-channel mean and standard deviation (shape ``(3,)``,
+# broadcast against ``(n, 256, 256, 3)``), then clipped to a range with a
+# gain. ``mean`` and ``std`` are float64, so the whole computation is
+# promoted to float64, doubling the size of every temporary:
+
+images = Input('images', (64, 256, 256, 3), np.float32)
+mean = Input('mean', (3,), np.float64)
+std = Input('std', (3,), np.float64)
+expr = (images - mean) / std * 0.5 + 0.5
+
+plan = plan_memory(expr)
+print(f'result: {plan["shape"]} {plan["dtype"]}')
+print(f'inputs: {plan["inputs"] / 2**20:.0f} MB')
+for op, nbytes in plan['temporaries']:
+    print(f'  {nbytes / 2**20:5.0f} MB  {op}')
+print(f'peak: {plan["peak"] / 2**20:.0f} MB, '
+      f'with out=: {plan["peak_out"] / 2**20:.0f} MB')
+print('\n'.join(plan['rewrite']))
+
+# %%
+# Let's check the prediction against ``tracemalloc``, which counts the
+# memory allocated on top of the inputs, by evaluating the expression and the
+# suggested rewrite:
+
+def measured_peak(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+rng = np.random.default_rng(0)
+arrays = {'images': rng.random(images.shape, dtype=np.float32),
+          'mean': np.array([0.5, 0.4, 0.3]), 'std': np.array([0.2, 0.2, 0.3])}
+
+def plain():
+    return (arrays['images'] - arrays['mean']) / arrays['std'] * 0.5 + 0.5
+
+def rewritten(plan, arrays):
+    namespace = {'np': np, **arrays}
+    exec('\n'.join(plan['rewrite']), namespace)
+    return namespace[plan['result']]
+
+def print_measured(plan, plain, arrays):
+    np.testing.assert_allclose(plain(), rewritten(plan, arrays))
+    peak = plan['inputs'] + measured_peak(plain)
+    peak_out = plan['inputs'] + measured_peak(lambda: rewritten(plan, arrays))
+    print(f'measured plain: {peak / 2**20:.0f} MB, '
+          f'out=: {peak_out / 2**20:.0f} MB')
+
+print_measured(plan, plain, arrays)
+
+# %%
+# When both operands of an operation are temporaries, the first one is still
+# alive while the second is evaluated, and only then can the result reuse
+# it. E.g., for ``a * b + c * d`` the two products are held together in
+# either version:
+
+terms = {name: Input(name, (2_000_000,)) for name in 'abcd'}
+plan2 = plan_memory(terms['a'] * terms['b'] + terms['c'] * terms['d'])
+print('\n'.join(plan2['rewrite']))
+print(f'predicted plain: {plan2["peak"] / 2**20:.0f} MB, '
+      f'out=: {plan2["peak_out"] / 2**20:.0f} MB')
+
+arrays2 = {name: rng.random(2_000_000) for name in 'abcd'}
+print_measured(plan2, lambda: arrays2['a'] * arrays2['b']
+               + arrays2['c'] * arrays2['d'], arrays2)
+
+# %%
+# The plain version measures less than predicted: for a large temporary that
+# nothing else refers to, NumPy writes the result of the next operation into
+# it when the other operand is a scalar or has the same shape (*temporary
+# elision*, on platforms where NumPy can check the caller, such as Linux).
+# Here the sum is written into the first product, as in the rewrite. In the
+# images example the first division cannot be elided, as ``std`` is
+# broadcast, which sets the peak. The plain prediction ignores elision, so it
+# can overestimate the peak but not underestimate it.
+
+# %%
+# Casting the parameters to float32 keeps the whole computation in float32,
+# which halves every temporary (and the result):
+
+plan32 = plan_memory(
+    (images - Input('mean', (3,), np.float32)) / Input('std', (3,), np.float32)
+    * 0.5 + 0.5)
+print(f'peak: {plan32["peak"] / 2**20:.0f} MB, '
+      f'with out=: {plan32["peak_out"] / 2**20:.0f} MB')
+
+# %%
+# As the peak grows linearly with the batch size, planning a batch of one
+# image gives the largest batch fitting in a memory budget, e.g. 1 GB:
+
+def normalise(n, dtype):
+    images = Input('images', (n, 256, 256, 3), np.float32)
+    return (images - Input('mean', (3,), dtype)) / \
+        Input('std', (3,), dtype) * 0.5 + 0.5
+
+budget = 2**30
+for dtype in [np.float64, np.float32]:
+    per_image = plan_memory(normalise(1, dtype))['peak_out']
+    print(f'{np.dtype(dtype)} parameters: {budget // per_image} images')
+
+# %%
+# Reusing buffers
+# ---------------
+#
+# As seen with ``np.empty()`` above, NumPy and the allocator underneath may
+# hand back memory just freed by an array of the same size, but nothing
+# guarantees it. Large arrays in particular are usually given back to the
+# operating system when freed, so a loop allocating the same temporaries on
+# every iteration pays for fresh memory (and the page faults of touching it)
+# every time.
+#
+# A buffer pool makes the reuse deliberate: released arrays are kept, keyed by
+# shape and dtype, and handed out again by ``acquire()``. The pool holds at
+# most ``max_bytes``; beyond that, the buffers of the least recently released
+# key are dropped. Only arrays owning their memory are taken back, views
+# would keep a larger array alive.
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class BufferPool:
+    """Free arrays kept for reuse, keyed by shape and dtype."""
+
+    def __init__(self, max_bytes=2**28):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._free = OrderedDict()
+
+    def acquire(self, shape, dtype=np.float64):
+        """Return an uninitialised array, like ``np.empty()``."""
+        shape = tuple(shape) if np.iterable(shape) else (shape,)
+        key = (shape, np.dtype(dtype))
+        buffers = self._free.get(key)
+        if buffers:
+            self.hits += 1
+            array = buffers.pop()
+            if not buffers:
+                del self._free[key]
+            self.nbytes -= array.nbytes
+            return array
+        self.misses += 1
+        return np.empty(*key)
+
+    def release(self, array):
+        """Give ``array`` back to the pool. It must not be used afterwards."""
+        if array.base is not None or not array.flags.c_contiguous:
+            return
+        key = (array.shape, array.dtype)
+        self._free.setdefault(key, []).append(array)
+        self._free.move_to_end(key)
+        self.nbytes += array.nbytes
+        while self.nbytes > self.max_bytes:
+            key, buffers = next(iter(self._free.items()))
+            self.nbytes -= buffers.pop().nbytes
+            if not buffers:
+                del self._free[key]
+
+    @contextmanager
+    def scope(self):
+        """Buffers acquired through the scope are released when it exits."""
+        scope = PoolScope(self)
+        try:
+            yield scope
+        finally:
+            for array in scope.acquired:
+                self.release(array)
+
+
+class PoolScope:
+    def __init__(self, pool):
+        self.pool = pool
+        self.acquired = []
+
+    def empty(self, shape, dtype=np.float64):
+        array = self.pool.acquire(shape, dtype)
+        self.acquired.append(array)
+        return array
+
+    def __call__(self, ufunc, *args, **kwargs):
+        """Apply ``ufunc``, writing the result into a buffer from the pool."""
+        shapes = {np.shape(arg) for arg in args} - {()}
+        shape = (shapes.pop() if len(shapes) == 1
+                 else np.broadcast_shapes(*shapes, ()))
+        dtypes = [arg.dtype if isinstance(arg, np.ndarray) else type(arg)
+                  for arg in args]
+        dtype = ufunc.resolve_dtypes((*dtypes, None))[-1]
+        return ufunc(*args, out=self.empty(shape, dtype), **kwargs)
+
+# %%
+# Inside a scope, ``scope(ufunc, *args)`` routes the ``out=`` of the ufunc
+# through the pool. The result is only valid until the scope exits, so
+# anything kept must be reduced or copied before:
+
+pool = BufferPool()
+x = np.linspace(0, 1, 5)
+with pool.scope() as scope:
+    t = scope(np.multiply, x, 2.0)
+    total = scope(np.sqrt, scope(np.add, t, 1.0)).sum()
+total, pool.nbytes, pool.misses
+
+# %%
+# Let's time a loop computing the same expression on new data every
+# iteration, with and without the pool. Each iteration allocates three
+# temporaries of the size of the input:
+
+def step(a, b, c):
+    return np.sqrt(a * b + c).sum()
+
+def step_pooled(a, b, c, pool):
+    with pool.scope() as scope:
+        t = scope(np.multiply, a, b)
+        np.add(t, c, out=t)
+        return np.sqrt(t, out=t).sum()
+
+for n in [10**3, 10**5, 10**7]:
+    a, b, c = (np.ones(n) for _ in range(3))
+    pool = BufferPool()
+    number = max(10**7 // n, 3)
+    for name, func in [('plain', lambda: step(a, b, c)),
+                       ('pool', lambda: step_pooled(a, b, c, pool))]:
+        best = min(timeit.repeat(func, number=number, repeat=3)) / number
+        print(f'n={n:.0e} {name:5} {best * 1e6:8.1f} us per iteration')
+    print(f'       pool: {pool.hits} hits, {pool.misses} misses')
+
+# %%
+# For small arrays the pool is slower: its bookkeeping in Python costs more
+# than the allocation, which NumPy (it caches small buffers itself) and the
+# allocator already serve from recently freed memory. It pays off for large
+# arrays, which the allocator gets fresh from the operating system on every
+# iteration, and has to fault into memory page by page. Writing into the
+# operands with ``out=`` (as ``step_pooled`` does with ``t``) also helps
+# there, since it removes allocations altogether.
@@ -297,6 +297,80 @@ iris.groupby('species', group_keys=False).apply(top)
 # index should be the group keys or just numbers. ``group_keys`` lets you
 # specify whether there should be a group keys index (as well as the original).
 #
+# Top n per group
+# ===============
+#
+# ``apply(top)`` calls ``top`` once per group, so each group is sorted
+# separately, in Python. With many groups this is slow. We can instead sort
+# the whole df once, by group and then by the column, and keep the last ``n``
+# rows of each group. The group of each row is given by its integer code from
+# ``pd.factorize`` (see Categorical data below) and the number of rows in each
+# group by ``np.bincount`` of the codes:
+
+def top_n_per_group(df, by, n=5, column='sepal_length', as_index=True,
+                    group_keys=True):
+    """Vectorised ``df.groupby(by, as_index=as_index,
+    group_keys=group_keys).apply(top)``."""
+    codes, uniques = pd.factorize(df[by], sort=True)
+    # sorts by codes, then column
+    order = np.lexsort((df[column].to_numpy(), codes))
+    # NA keys have code -1, groupby excludes them
+    order = order[codes[order] >= 0]
+    sorted_codes = codes[order]
+    group_ends = np.cumsum(np.bincount(sorted_codes, minlength=len(uniques)))
+    # keep rows that are at most n from the end of their group
+    keep = group_ends[sorted_codes] - np.arange(len(order)) <= n
+    result = df.iloc[order[keep]].drop(columns=by)
+    if as_index and group_keys:
+        result.index = pd.MultiIndex.from_arrays(
+            [uniques[sorted_codes[keep]], result.index],
+            names=[by, df.index.name])
+    return result
+
+top_n_per_group(iris, 'species')
+
+#%%
+# As with ``apply()`` in recent versions of pandas, the grouping column is
+# not included, and the group keys are only added to the index with both
+# ``as_index=True`` and ``group_keys=True``: with ``as_index=False``, pandas 3
+# no longer adds an integer level in their place. The same rows are returned,
+# though rows with equal values may come in a different order:
+
+for as_index in [True, False]:
+    for group_keys in [True, False]:
+        expected = iris.groupby('species', as_index=as_index,
+                                group_keys=group_keys).apply(top)
+        result = top_n_per_group(iris, 'species', as_index=as_index,
+                                 group_keys=group_keys)
+        print(f'as_index={as_index!s:5} group_keys={group_keys!s:5}',
+              result.sort_index().equals(expected.sort_index()))
+
+#%%
+# ``sort_values()`` followed by ``groupby().tail(n)`` gives the same rows and
+# is also vectorised, although ``tail`` needs a second pass to group the
+# sorted df. Let's compare all 3 as the number of groups increases:
+
+import timeit
+
+n_rows = 100_000
+rng = np.random.default_rng(0)
+for n_groups in [10, 100, 1000]:
+    big = pd.DataFrame({'key': rng.integers(n_groups, size=n_rows),
+                        'sepal_length': rng.random(n_rows)})
+    methods = {
+        'apply(top)': lambda: big.groupby('key').apply(top),
+        'sort + tail': lambda: big.sort_values(['key', 'sepal_length'])
+                                  .groupby('key').tail(5),
+        'top_n_per_group': lambda: top_n_per_group(big, 'key'),
+    }
+    for name, method in methods.items():
+        seconds = min(timeit.repeat(method, number=1, repeat=3))
+        print(f'{n_groups:>5} groups {name:16} {seconds * 1e3:8.1f} ms')
+
+#%%
+# With a handful of groups ``apply()`` is fine, but its time grows with the
+# number of groups while the vectorised versions stay flat.
+#
 # Transform
 # =========
 #
@@ -321,6 +395,111 @@ df.groupby('key').transform(lambda x: x.mean())
 #
 #   normalized = (df['value'] - g.transform('mean')) / g.transform('std')
 #
+# How much faster? Below we time 4 ways of normalizing within groups:
+#
+# * ``transform`` with a lambda, called once per group
+# * ``transform`` with the string aliases, as above
+# * ``apply(normalize)``, also called once per group
+# * plain NumPy. ``pd.factorize`` gives an integer code for the group of each
+#   row, then ``np.bincount`` with ``weights`` sums the values of each group in
+#   one pass. Indexing the per group results with the codes broadcasts them
+#   back to the rows.
+
+def normalize(x):
+    return (x - x.mean()) / x.std()
+
+def normalize_numpy(keys, values):
+    codes, _ = pd.factorize(keys)
+    # missing keys have code -1: like groupby, leave their rows out (as NaN)
+    valid = codes >= 0
+    codes = codes[valid]
+    values = values[valid]
+    counts = np.bincount(codes)
+    means = np.bincount(codes, weights=values) / counts
+    deviations = values - means[codes]
+    result = np.full(len(valid), np.nan)
+    # ddof=1, like pandas std(), which is NaN for groups of 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stds = np.sqrt(np.bincount(codes, weights=deviations**2)
+                       / (counts - 1))
+        result[valid] = deviations / stds[codes]
+    return result
+
+strategies = {
+    'transform(lambda)': lambda df, g: g['value'].transform(
+        lambda x: (x - x.mean()) / x.std()),
+    "transform('mean')": lambda df, g: (
+        (df['value'] - g['value'].transform('mean'))
+        / g['value'].transform('std')),
+    'apply(normalize)': lambda df, g: g['value'].apply(normalize),
+    'numpy bincount': lambda df, g: normalize_numpy(
+        df['key'].to_numpy(), df['value'].to_numpy()),
+}
+
+#%%
+# All 4 give the same result. With ``group_keys=False``, ``apply`` does not
+# add the group keys to the index, so every pandas version keeps the index of
+# ``df``. ``normalize_numpy`` returns a plain array, so we compare values
+# only:
+
+df = pd.DataFrame({'key': ['a', 'b', 'c'] * 4,
+                   'value': np.arange(12.)})
+g = df.groupby('key', group_keys=False)
+for name, strategy in strategies.items():
+    print(name, np.allclose(np.asarray(strategy(df, g)),
+                            strategies["transform('mean')"](df, g)))
+
+#%%
+# ``groupby`` leaves out the rows with a missing key, and ``transform``
+# returns NaN for them. ``pd.factorize`` gives them the code -1, which
+# ``np.bincount`` rejects, so ``normalize_numpy`` masks them out and returns
+# NaN as well:
+
+df_missing = df.assign(key=df['key'].where(df.index % 5 != 0))
+g_missing = df_missing.groupby('key', group_keys=False)
+np.allclose(strategies['numpy bincount'](df_missing, g_missing),
+            strategies["transform('mean')"](df_missing, g_missing),
+            equal_nan=True)
+
+#%%
+# For each number of rows and of groups we report the throughput, in millions
+# of rows per second, and the peak memory allocated, measured with
+# ``tracemalloc`` in a separate run. Add larger sizes to ``n_rows_list`` and
+# ``n_groups_list`` to size production jobs.
+
+import timeit
+import tracemalloc
+
+def benchmark_normalize(n_rows, n_groups, repeat=3):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'key': rng.integers(n_groups, size=n_rows),
+                       'value': rng.random(n_rows)})
+    g = df.groupby('key', group_keys=False)
+    results = {}
+    for name, strategy in strategies.items():
+        seconds = min(timeit.repeat(lambda: strategy(df, g), number=1,
+                                    repeat=repeat))
+        tracemalloc.start()
+        strategy(df, g)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = (n_rows / seconds / 1e6, peak / 2**20)
+    return results
+
+n_rows_list = [10_000, 100_000]
+n_groups_list = [10, 1000]
+for n_rows in n_rows_list:
+    for n_groups in n_groups_list:
+        for name, (throughput, peak) in benchmark_normalize(
+                n_rows, n_groups).items():
+            print(f'{n_rows:>7} rows {n_groups:>5} groups {name:18} '
+                  f'{throughput:7.2f} Mrows/s {peak:6.1f} MB')
+
+#%%
+# The per group Python calls of the lambda and ``apply`` dominate as the
+# number of groups grows. The string aliases run in Cython and are close to
+# the NumPy version, and both allocate far less.
+#
 # ****************
 # Categorical data
 # ****************
@@ -341,6 +520,152 @@ df.groupby('key').transform(lambda x: x.mean())
 # to specify order. The printed output will have ``<`` signs between the
 # categories to show order.
 #
+# Reusing the encoding
+# ====================
+#
+# Every ``groupby('key')`` call hashes the key column again to find the
+# groups. When we compute many aggregations and transforms over the same keys,
+# we can factorize them once and keep everything derived from the codes: the
+# size of each group, the order that sorts the rows by group and where each
+# group starts and ends in that order. The order is only needed by some
+# methods, so it is computed the first time it is used.
+
+from functools import cached_property
+
+class Grouping:
+    """Groups of ``keys``, factorized once and reused.
+
+    Aggregations return a Series indexed by the (sorted) groups. Transforms
+    return an array aligned with ``keys``. Missing keys are excluded from the
+    groups, as in ``groupby``, and are NaN in transforms.
+    """
+
+    def __init__(self, keys):
+        codes, self.categories = pd.factorize(keys, sort=True)
+        self.ngroups = len(self.categories)
+        self.valid = codes >= 0
+        # small integer codes make the stable argsort below a radix sort
+        self.codes = codes[self.valid].astype(np.min_scalar_type(self.ngroups))
+        self.counts = np.bincount(self.codes, minlength=self.ngroups)
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)])
+
+    @cached_property
+    def order(self):
+        """Rows sorted by group.
+
+        Group i is ``order[starts[i]:starts[i + 1]]``.
+        """
+        rows = np.flatnonzero(self.valid)
+        return rows[np.argsort(self.codes, kind='stable')]
+
+    def _series(self, values, name=None):
+        return pd.Series(values, index=self.categories, name=name)
+
+    def _sums(self, values):
+        return np.bincount(self.codes, weights=values[self.valid],
+                           minlength=self.ngroups)
+
+    def size(self):
+        return self._series(self.counts)
+
+    def sum(self, values):
+        return self._series(self._sums(values))
+
+    def mean(self, values):
+        return self._series(self._sums(values) / self.counts)
+
+    def std(self, values, ddof=1):
+        means = self._sums(values) / self.counts
+        deviations = values[self.valid] - means[self.codes]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var = np.bincount(self.codes, weights=deviations**2,
+                              minlength=self.ngroups) / (self.counts - ddof)
+        return self._series(np.sqrt(var))
+
+    def min(self, values):
+        return self._series(
+            np.minimum.reduceat(values[self.order], self.starts[:-1]))
+
+    def max(self, values):
+        return self._series(
+            np.maximum.reduceat(values[self.order], self.starts[:-1]))
+
+    def apply(self, func, values):
+        """Call ``func`` on the values of each group."""
+        sorted_values = values[self.order]
+        return self._series([func(sorted_values[start:end]) for start, end
+                             in zip(self.starts[:-1], self.starts[1:])])
+
+    def transform(self, how, values):
+        """Broadcast the aggregation ``how`` (e.g. 'mean') back to the rows."""
+        result = np.full(len(self.valid), np.nan)
+        result[self.valid] = getattr(self, how)(values).to_numpy()[self.codes]
+        return result
+
+#%%
+# It gives the same results as ``groupby``:
+
+rng = np.random.default_rng(0)
+n_rows = 1_000_000
+big = pd.DataFrame({'key': rng.choice([f'k{i}' for i in range(1000)],
+                                      size=n_rows),
+                    'a': rng.random(n_rows),
+                    'b': rng.random(n_rows)})
+grouping = Grouping(big['key'])
+a = big['a'].to_numpy()
+for how in ['size', 'sum', 'mean', 'std', 'min', 'max']:
+    args = () if how == 'size' else (a,)
+    expected = getattr(big.groupby('key')['a'], how)()
+    print(how, np.allclose(getattr(grouping, how)(*args), expected))
+print('transform', np.allclose(grouping.transform('mean', a),
+                               big.groupby('key')['a'].transform('mean')))
+
+#%%
+# Now the same 10 aggregations and transforms, first with a ``groupby`` per
+# call, then with a ``groupby`` on the category dtype and finally with a
+# single ``Grouping``. Converting to category and building the ``Grouping``
+# are included in the times, the best of 3 runs.
+
+import timeit
+
+def with_groupby(df, key):
+    results = []
+    for col in ['a', 'b']:
+        for how in ['sum', 'mean', 'std', 'max']:
+            results.append(getattr(df.groupby(key)[col], how)())
+        results.append(df.groupby(key)[col].transform('mean'))
+    return results
+
+def with_grouping(df, key):
+    grouping = Grouping(df[key])
+    results = []
+    for col in ['a', 'b']:
+        values = df[col].to_numpy()
+        for how in ['sum', 'mean', 'std', 'max']:
+            results.append(getattr(grouping, how)(values))
+        results.append(grouping.transform('mean', values))
+    return results
+
+def with_category(df, key):
+    return with_groupby(df.astype({key: 'category'}), key)
+
+for name, func in [('groupby', with_groupby),
+                   ('groupby category', with_category),
+                   ('Grouping', with_grouping)]:
+    seconds = min(timeit.repeat(lambda: func(big, 'key'), number=1,
+                                repeat=3))
+    print(f'{name:17} {seconds:.3f} s')
+
+#%%
+# Factorizing the string keys once makes ``Grouping`` about 4 times faster
+# than a ``groupby`` per call, which factorizes them again every time. Most
+# of that gain comes from not hashing the strings again: ``groupby`` on the
+# category dtype, whose codes are already integers, is only slightly slower
+# than ``Grouping``. Converting the key to category is therefore the simpler
+# choice, and ``Grouping`` only adds a little on top when the same groups are
+# used many times.
+
+#%%
 # *********
 # Reshaping
 # *********
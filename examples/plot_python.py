@@ -125,6 +125,113 @@ print(1e-308 / np.pi / 1e16)
 # make all denormals to be 0 and calculations that result in denormal should
 # give 0 instead.
 #
+# Flushing denormals to zero
+# ==========================
+#
+# On x86-64 CPUs, SSE and AVX floating point arithmetic (used by NumPy, and by
+# Python floats) is controlled by the per thread ``MXCSR`` register. Two of
+# its bits avoid denormals:
+#
+# * FTZ (flush to zero) - results that would be denormal are set to 0.
+# * DAZ (denormals are zero) - denormal inputs are read as 0.
+#
+# NumPy does not expose them, but on Linux the C library (glibc) does,
+# through the ``fegetenv()`` and ``fesetenv()`` functions of ``<fenv.h>``.
+# They copy the floating point environment of the thread to and from a
+# 32 byte ``fenv_t`` struct, which on x86-64 holds ``MXCSR`` at offset 28.
+# We can call them with ``ctypes`` on a buffer of that size, and change the
+# two bits in between. Elsewhere (other CPUs, or C libraries with another
+# layout of ``fenv_t``) ``mxcsr`` is ``None``.
+
+import contextlib
+import ctypes
+import platform
+import sys
+
+FTZ = 0x8000
+DAZ = 0x0040
+_FENV_SIZE = 32
+_MXCSR_OFFSET = 28
+
+def _mxcsr_functions():
+    """Return functions getting and setting MXCSR, or None if unsupported."""
+    if not (sys.platform.startswith('linux')
+            and platform.machine() == 'x86_64'
+            and platform.libc_ver()[0] == 'glibc'):
+        return None
+    libc = ctypes.CDLL(None)
+
+    def get_env():
+        env = ctypes.create_string_buffer(_FENV_SIZE)
+        if libc.fegetenv(env) != 0:
+            raise OSError('fegetenv failed')
+        return env
+
+    def get_mxcsr():
+        return ctypes.c_uint32.from_buffer(get_env(), _MXCSR_OFFSET).value
+
+    def set_mxcsr(value):
+        # keep the rest of the environment (x87 control word, flags) as is
+        env = get_env()
+        ctypes.c_uint32.from_buffer(env, _MXCSR_OFFSET).value = value
+        if libc.fesetenv(env) != 0:
+            raise OSError('fesetenv failed')
+
+    return get_mxcsr, set_mxcsr
+
+mxcsr = _mxcsr_functions()
+
+@contextlib.contextmanager
+def flush_denormals(ftz=True, daz=True):
+    """Turn on FTZ and/or DAZ in the current thread, for the block."""
+    if mxcsr is None:
+        raise OSError('FTZ/DAZ are only supported on x86-64 Linux with glibc')
+    get_mxcsr, set_mxcsr = mxcsr
+    old = get_mxcsr()
+    set_mxcsr(old | (FTZ if ftz else 0) | (DAZ if daz else 0))
+    try:
+        yield
+    finally:
+        set_mxcsr(old)
+
+if mxcsr is not None:
+    with flush_denormals():
+        print(1e-308 / np.pi / 1e10)
+    print(1e-308 / np.pi / 1e10)
+
+# %%
+# The register belongs to the thread, so the mode does not apply to other
+# threads (e.g., those of a BLAS library) and everything in the block is
+# affected, Python floats included - keep the block small.
+#
+# Let's simulate the tail of a decaying filter: 10,000 channels, each
+# multiplied by 0.9 at every step. Starting from 1.0, the values stay normal;
+# starting from 1e-300 they soon become denormal (and eventually 0). Both
+# workloads are timed without and with the mode:
+
+import time
+
+def decay(start, n_steps=500, n_channels=10_000, factor=0.9):
+    state = np.full(n_channels, start)
+    t0 = time.perf_counter()
+    for _ in range(n_steps):
+        np.multiply(state, factor, out=state)
+    return time.perf_counter() - t0
+
+if mxcsr is not None:
+    for name, start in [('normal', 1.0), ('denormal', 1e-300)]:
+        plain = min(decay(start) for _ in range(3))
+        with flush_denormals():
+            flushed = min(decay(start) for _ in range(3))
+        print(f'{name:8} {plain * 1e3:6.1f} ms, with FTZ/DAZ '
+              f'{flushed * 1e3:6.1f} ms')
+
+# %%
+# Here arithmetic on denormals is over ten times slower, and with
+# FTZ/DAZ the denormal workload runs as fast as the normal one. The price is
+# accuracy: values below ~2.2e-308 become 0, which is harmless for decaying
+# signals but changes results that rely on gradual underflow.
+#
 # **********
 # Write/Read
 # **********
@@ -138,6 +245,161 @@ print(1e-308 / np.pi / 1e16)
 # * ``r+`` read and write
 # * ``b`` binary files
 #
+# Reading large files
+# ===================
+#
+# Iterating over a file opened in text mode is convenient, but for each line
+# Python finds the line break, decodes the bytes and creates a new ``str``.
+# For files of many GB this per line work dominates. Two binary strategies
+# avoid it, by finding the line boundaries of a whole block at once with
+# NumPy and never copying the lines themselves:
+#
+# * ``readinto`` fills one reusable ``bytearray`` (no new buffer per read).
+#   The partial line at the end of a block is moved to the front of the
+#   buffer before the next read.
+# * ``mmap`` maps the file into memory: the operating system pages it in as
+#   it is accessed, without any read calls or copies into our own buffer.
+#
+# Both yield batches of ``(view, starts, ends)``: a ``memoryview`` of the
+# data and the offsets of each line in it (without its line break), so line
+# ``i`` is ``view[starts[i]:ends[i]]``. The view is only valid until the next
+# batch; copy the lines you want to keep with ``bytes()``.
+
+import mmap
+import os
+import tempfile
+
+def _line_bounds(data, offset=0):
+    """Start and end offsets of the complete lines in the uint8 ``data``."""
+    ends = np.flatnonzero(data == ord('\n'))
+    starts = np.empty_like(ends)
+    starts[:1] = 0
+    starts[1:] = ends[:-1] + 1
+    return starts + offset, ends + offset
+
+def readinto_lines(file_name, block_size=2**20):
+    buffer = bytearray(block_size)
+    kept = 0
+    with open(file_name, 'rb', buffering=0) as f:
+        while True:
+            if kept == len(buffer):
+                # line longer than the buffer
+                buffer = buffer + bytearray(len(buffer))
+            with memoryview(buffer) as view:
+                n = f.readinto(view[kept:])
+                filled = kept + n
+                if n == 0:
+                    if kept:
+                        # last line, without a line break
+                        yield view, np.array([0]), np.array([kept])
+                    return
+                data = np.frombuffer(buffer, np.uint8, filled)
+                starts, ends = _line_bounds(data)
+                del data
+                if len(ends):
+                    yield view, starts, ends
+            last = ends[-1] + 1 if len(ends) else 0
+            kept = filled - last
+            buffer[:kept] = buffer[last:filled]
+
+def mmap_lines(file_name, block_size=2**24):
+    with open(file_name, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                memoryview(mm) as view:
+            data = np.frombuffer(mm, np.uint8)
+            start = 0
+            try:
+                while start < size:
+                    stop = min(start + block_size, size)
+                    starts, ends = _line_bounds(data[start:stop], start)
+                    if len(ends):
+                        yield view, starts, ends
+                        start = ends[-1] + 1
+                    elif stop == size:
+                        # last line, without a line break
+                        yield view, np.array([start]), np.array([size])
+                        start = size
+                    else:
+                        # line longer than the block
+                        block_size *= 2
+            finally:
+                # the mmap cannot be closed while arrays use it
+                del data
+
+def read_lines(file_name, strategy='mmap', block_size=None):
+    """Iterate over the lines of ``file_name``.
+
+    The 'text' strategy yields ``str`` lines; 'readinto' and 'mmap' yield
+    ``(view, starts, ends)`` batches of line boundaries.
+    """
+    if strategy == 'text':
+        with open(file_name) as f:
+            yield from f
+        return
+    readers = {'readinto': readinto_lines, 'mmap': mmap_lines}
+    kwargs = {} if block_size is None else {'block_size': block_size}
+    yield from readers[strategy](file_name, **kwargs)
+
+# the files of the examples below go here, removed at the end of the page
+tmp_dir = tempfile.TemporaryDirectory()
+file_name = os.path.join(tmp_dir.name, 'example.log')
+with open(file_name, 'w') as f:
+    f.write('first line\nsecond\n\nlast, no line break')
+for view, starts, ends in read_lines(file_name, 'readinto', block_size=8):
+    print([bytes(view[s:e]) for s, e in zip(starts, ends)])
+
+# %%
+# Let's count the lines and their total length in files of several sizes and
+# line lengths. The files were just written, so they are in the operating
+# system's page cache: this measures the cost of the reading strategy, not of
+# the disk.
+
+import timeit
+
+def count_text(file_name):
+    n = length = 0
+    for line in read_lines(file_name, 'text'):
+        n += 1
+        length += len(line) - 1
+    return n, length
+
+def count_batches(file_name, strategy):
+    n = length = 0
+    for view, starts, ends in read_lines(file_name, strategy):
+        n += len(ends)
+        length += int((ends - starts).sum())
+    return n, length
+
+for size in [2**24, 2**26]:
+    for line_length in [32, 256]:
+        line = 'x' * (line_length - 1) + '\n'
+        file_name = os.path.join(tmp_dir.name, f'{size}_{line_length}.log')
+        with open(file_name, 'w') as f:
+            f.write(line * (size // line_length))
+        n_lines = size // line_length
+        counters = {'text': lambda: count_text(file_name),
+                    'readinto': lambda: count_batches(file_name, 'readinto'),
+                    'mmap': lambda: count_batches(file_name, 'mmap')}
+        results = []
+        for strategy, count in counters.items():
+            assert count() == (n_lines, n_lines * (line_length - 1))
+            seconds = min(timeit.repeat(count, number=1, repeat=3))
+            results.append(f'{strategy} {size / seconds / 2**20:6.0f} MB/s')
+        print(f'{size // 2**20:3} MB, {line_length:3} B lines: '
+              + ', '.join(results))
+        os.remove(file_name)
+
+# %%
+# The text iteration is limited by the number of lines, so it is slowest
+# with short lines. The binary strategies only do a fixed amount of Python
+# work per block and are many times faster. ``mmap`` avoids copying the data
+# into a buffer, but it has to fault in every page on first access, so it is
+# not always faster than ``readinto`` with a buffer that fits in the CPU
+# cache.
+#
 # ***************
 # Standard libary
 # ***************
@@ -165,6 +427,152 @@ print(1e-308 / np.pi / 1e16)
 #
 # * ``pickle`` - store arbitrary objects to a file
 #
+# Pickling large arrays
+# =====================
+#
+# Ref: `PEP 574 <https://peps.python.org/pep-0574/>`_
+#
+# ``pickle.dumps()`` copies the data of every array into the pickle, and
+# ``pickle.loads()`` copies it again into new arrays. Protocol 5 can instead
+# hand large buffers (e.g., the data of NumPy arrays, including those of
+# pandas DataFrames) 'out of band' to a ``buffer_callback``, as
+# ``PickleBuffer`` objects; the pickle itself then only holds the metadata.
+# When loading, the buffers are passed back to ``pickle.loads(buffers=...)``
+# and the arrays are created on top of them, without copying.
+#
+# Below, the pickle and the buffers are laid out one after the other: a
+# header with the sizes, the pickle, then each buffer aligned to 64 bytes.
+# The layout can be written to a file or into shared memory. Loading from a
+# file memory-maps it (copy-on-write, so the arrays are writable without
+# changing the file), so data is only read from disk when it is used.
+
+import pickle
+import struct
+from multiprocessing import shared_memory
+
+_MAGIC = b'PKB5'
+_ALIGN = 64
+
+def _aligned(n):
+    return -(-n // _ALIGN) * _ALIGN
+
+def _layout(obj):
+    """Return the header and pickle, the buffers and their offsets."""
+    buffers = []
+    data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    buffers = [buffer.raw() for buffer in buffers]
+    header = struct.pack(f'<4sQQ{len(buffers)}Q', _MAGIC, len(buffers),
+                         len(data), *(b.nbytes for b in buffers))
+    offset = _aligned(len(header) + len(data))
+    offsets = []
+    for buffer in buffers:
+        offsets.append(offset)
+        offset = _aligned(offset + buffer.nbytes)
+    return header + data, buffers, offsets, offset
+
+def loads_from(view):
+    """Load an object laid out by ``dump`` from the buffer ``view``.
+
+    The arrays of the object use the memory of ``view``, which must stay
+    valid (e.g., not closed) while they are used.
+    """
+    view = memoryview(view)
+    magic, n_buffers, n_data = struct.unpack_from('<4sQQ', view)
+    if magic != _MAGIC:
+        raise ValueError('not an out-of-band pickle')
+    sizes = struct.unpack_from(f'<{n_buffers}Q', view, 20)
+    start = 20 + 8 * n_buffers
+    offset = _aligned(start + n_data)
+    buffers = []
+    for size in sizes:
+        buffers.append(view[offset:offset + size])
+        offset = _aligned(offset + size)
+    return pickle.loads(view[start:start + n_data], buffers=buffers)
+
+def dump(obj, file_name):
+    head, buffers, offsets, _ = _layout(obj)
+    with open(file_name, 'wb') as f:
+        f.write(head)
+        for buffer, offset in zip(buffers, offsets):
+            f.seek(offset)
+            f.write(buffer)
+
+def load(file_name):
+    with open(file_name, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    return loads_from(mm)
+
+def to_shared_memory(obj):
+    """Copy ``obj`` into a new block of shared memory, returned."""
+    head, buffers, offsets, size = _layout(obj)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    shm.buf[:len(head)] = head
+    for buffer, offset in zip(buffers, offsets):
+        shm.buf[offset:offset + buffer.nbytes] = buffer
+    return shm
+
+# %%
+# Another process can attach to the shared memory by its name,
+# ``shared_memory.SharedMemory(name)``, and load the object from its ``buf``.
+# As the arrays point into the shared memory, it can only be closed once
+# they are gone:
+
+import pandas as pd
+
+df = pd.DataFrame({'a': np.arange(5.0), 'b': np.arange(5)})
+shm = to_shared_memory(df)
+attached = shared_memory.SharedMemory(shm.name)
+df_shared = loads_from(attached.buf)
+print(df_shared)
+print(np.shares_memory(df_shared['a'].to_numpy(), np.asarray(attached.buf)))
+del df_shared
+attached.close()
+shm.close()
+shm.unlink()
+
+# %%
+# Let's compare a round trip through a file of arrays of 1 to 256 MB (add
+# larger sizes, e.g. ``2**30`` and ``10 * 2**30``, if you have the memory and
+# disk space): pickle to a file, load it back and sum the array (so that the
+# memory-mapped data is actually read). Peak memory is measured with
+# ``tracemalloc`` in a separate run; it does not include the mapped file,
+# whose pages belong to the operating system's page cache and can be
+# dropped when memory is short.
+
+import tracemalloc
+
+def round_trip_pickle(array, file_name):
+    with open(file_name, 'wb') as f:
+        f.write(pickle.dumps(array))
+    with open(file_name, 'rb') as f:
+        return pickle.loads(f.read()).sum()
+
+def round_trip_out_of_band(array, file_name):
+    dump(array, file_name)
+    return load(file_name).sum()
+
+file_name = os.path.join(tmp_dir.name, 'array.pkl')
+for size in [2**20, 2**24, 2**28]:
+    array = np.ones(size // 8)
+    for round_trip in [round_trip_pickle, round_trip_out_of_band]:
+        assert round_trip(array, file_name) == array.size
+        seconds = min(timeit.repeat(lambda: round_trip(array, file_name),
+                                    number=1, repeat=3))
+        tracemalloc.start()
+        round_trip(array, file_name)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f'{size // 2**20:4} MB {round_trip.__name__:22} '
+              f'{seconds * 1e3:7.1f} ms, peak {peak / size:.2f}x')
+    os.remove(file_name)
+
+# %%
+# ``pickle.dumps`` builds the whole pickle in memory and loading reads the
+# file into ``bytes`` before creating the array from them, so the default
+# round trip allocates about 2.5 times the size of the array at its peak. The
+# out-of-band version writes the array's memory straight to the file and
+# maps it back, so it allocates almost nothing.
+#
 # ******************
 # Exception handling
 # ******************
@@ -332,3 +740,380 @@ finally:
 # instantiates an object of the ``Logger`` class. Calling it several times
 # with the same name will return a reference to the same object. This saves
 # us from passing the logger object around to different parts that need it.
+#
+# Logging without blocking
+# ========================
+#
+# Handlers run in the thread that logs: ``logger.info()`` returns only once
+# every handler has formatted the record and written it (and a
+# ``FileHandler`` flushes after every record). In a hot loop this I/O shows
+# up in the latency of every call.
+#
+# ``QueueHandler`` instead puts the record on a queue and returns, and a
+# ``QueueListener`` thread takes records off the queue and passes them to the
+# real handlers. Two more things make this suitable for heavy logging:
+#
+# * A bounded queue, so a burst of records cannot use up the memory. When the
+#   queue is full, the ``'block'`` policy waits for the listener (no record is
+#   lost, but the caller slows down), the ``'drop'`` policy discards the
+#   record and counts it.
+# * Batched flushes: the file handler only flushes every ``batch_size``
+#   records, or when the queue has been idle for ``interval`` seconds, and
+#   on shutdown.
+
+import io
+import logging
+import logging.handlers
+import queue
+import threading
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """``QueueHandler`` on a bounded queue, dropping or blocking when full."""
+
+    def __init__(self, maxsize=10_000, policy='drop'):
+        if policy not in ('drop', 'block'):
+            raise ValueError(
+                f"policy must be 'drop' or 'block', not {policy!r}")
+        super().__init__(queue.Queue(maxsize))
+        self.policy = policy
+        self.dropped = 0
+        self._lock_dropped = threading.Lock()
+
+    def prepare(self, record):
+        # The default copies the record and formats it fully, in the calling
+        # thread. Merging the arguments into the message is enough to keep
+        # later changes to mutable arguments out of the log. The template is
+        # kept, for filters grouping records by message (see below).
+        record.template = record.msg
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self.policy == 'block':
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock_dropped:
+                self.dropped += 1
+
+
+class BatchingStreamHandler(logging.StreamHandler):
+    """``StreamHandler`` flushing every ``batch_size`` records."""
+
+    def __init__(self, *args, batch_size=256, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_size = batch_size
+        self._pending = 0
+
+    def flush(self):
+        # StreamHandler.emit() calls flush() after every record
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush_now()
+
+    def flush_now(self):
+        self._pending = 0
+        super().flush()
+
+    def close(self):
+        self.flush_now()
+        super().close()
+
+
+class BatchingFileHandler(BatchingStreamHandler, logging.FileHandler):
+    """``FileHandler`` flushing every ``batch_size`` records."""
+
+
+class FlushingQueueListener(logging.handlers.QueueListener):
+    """``QueueListener`` flushing its handlers when the queue is idle."""
+
+    def __init__(self, queue, *handlers, interval=1.0, **kwargs):
+        super().__init__(queue, *handlers, **kwargs)
+        self.interval = interval
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, timeout=self.interval)
+            except queue.Empty:
+                self.flush()
+
+    def enqueue_sentinel(self):
+        # the default put_nowait() fails if a bounded queue is full
+        self.queue.put(self._sentinel)
+
+    def flush(self):
+        for handler in self.handlers:
+            getattr(handler, 'flush_now', handler.flush)()
+
+    def stop(self):
+        super().stop()
+        self.flush()
+
+def queue_logging(target, logger=None, level=logging.INFO,
+                  format=logging.BASIC_FORMAT, maxsize=10_000,
+                  policy='drop', batch_size=256, interval=1.0):
+    """Log records of ``logger`` (the root logger by default) to ``target``,
+    a file name or a stream, from a background thread.
+
+    Returns the queue handler (for its ``dropped`` counter) and the started
+    listener: call its ``stop()`` on shutdown to write the remaining records.
+    """
+    if isinstance(target, str):
+        handler = BatchingFileHandler(target, batch_size=batch_size)
+    else:
+        handler = BatchingStreamHandler(target, batch_size=batch_size)
+    handler.setFormatter(logging.Formatter(format))
+    queue_handler = BoundedQueueHandler(maxsize, policy)
+    listener = FlushingQueueListener(queue_handler.queue, handler,
+                                     interval=interval)
+    logger = logging.getLogger(logger)
+    logger.addHandler(queue_handler)
+    logger.setLevel(level)
+    listener.start()
+    return queue_handler, listener
+
+# %%
+# Let's log records to a file from a loop, timing every call, with
+# ``basicConfig()`` and with the queue (large enough, or small and dropping
+# records). Throughput is the rate of the loop; 'drained' also includes the
+# time for the listener to write everything that was queued.
+#
+# Writing to a local file mostly goes to the operating system's page cache
+# and is fast. To see what happens with slower destinations (a network file
+# system, a pipe to a log shipper, a busy disk), the second scenario logs to
+# a file where each write to the operating system takes an extra 0.1 ms. The
+# root logger is restored afterwards.
+
+class SlowFile(io.FileIO):
+    """File whose writes take ``latency`` seconds longer."""
+
+    latency = 1e-4
+
+    def write(self, b):
+        time.sleep(self.latency)
+        return super().write(b)
+
+def log_records(logger, n):
+    latencies = np.empty(n)
+    t0 = time.perf_counter()
+    for i in range(n):
+        start = time.perf_counter()
+        logger.info('request %d served in %.1f ms', i, 0.5)
+        latencies[i] = time.perf_counter() - start
+    return time.perf_counter() - t0, latencies
+
+def bench_logging(setup, slow, n):
+    root = logging.getLogger()
+    saved = root.handlers[:], root.level
+    log_file = os.path.join(tmp_dir.name, 'bench.log')
+    target = (io.TextIOWrapper(io.BufferedWriter(SlowFile(log_file, 'w')))
+              if slow else log_file)
+    try:
+        t0 = time.perf_counter()
+        stop = setup(target)
+        seconds, latencies = log_records(logging.getLogger('bench'), n)
+        dropped = stop()
+        drained = time.perf_counter() - t0
+    finally:
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+            handler.close()
+        root.handlers[:], root.level = saved
+        if slow:
+            target.close()
+    with open(log_file) as f:
+        written = sum(1 for _ in f)
+    os.remove(log_file)
+    p50, p99, p999 = np.percentile(latencies, [50, 99, 99.9]) * 1e6
+    return (f'{n / seconds:6.0f} records/s, drained {drained:.2f} s, '
+            f'latency p50 {p50:5.1f} p99 {p99:6.1f} p99.9 {p999:6.1f} us, '
+            f'{written} written, {dropped} dropped')
+
+def setup_basic(target):
+    if isinstance(target, str):
+        logging.basicConfig(filename=target, level=logging.INFO, force=True)
+    else:
+        logging.basicConfig(stream=target, level=logging.INFO, force=True)
+    return lambda: 0
+
+def setup_queue(maxsize, policy):
+    def setup(target):
+        logging.getLogger().handlers.clear()
+        handler, listener = queue_logging(target, maxsize=maxsize,
+                                          policy=policy)
+
+        def stop():
+            listener.stop()
+            return handler.dropped
+        return stop
+    return setup
+
+for slow, n in [(False, 20_000), (True, 5_000)]:
+    print('slow file' if slow else 'local file')
+    for name, setup in [('basicConfig', setup_basic),
+                        ('queue, block', setup_queue(10_000, 'block')),
+                        ('queue, drop', setup_queue(1_000, 'drop'))]:
+        print(f'  {name:13} {bench_logging(setup, slow, n)}')
+
+# %%
+# With a local file, the queue makes the typical call a little quicker, but
+# not the loop: the listener still formats and writes every record, and
+# because of the GIL it competes with the logging thread, which shows as
+# rare multi-millisecond stalls (the GIL switch interval is 5 ms). In a loop
+# doing nothing but logging, the listener cannot keep up, so a small queue
+# drops records. With a slow destination, ``basicConfig`` pays the latency
+# on every call, whereas the queue pays it once per batch, in the listener:
+# the loop is many times faster. Use the queue when the destination can be
+# slow, and the 'drop' policy only for logs you can afford to lose.
+
+# %%
+# Surviving log storms
+# ====================
+#
+# When something breaks in a hot loop, the same error can be logged millions
+# of times, each with a full traceback, and logging becomes the bottleneck.
+# Two things help:
+#
+# * A filter that rate limits records per (logger, level, message template).
+#   Each key gets a *token bucket*: it holds up to ``burst`` tokens, refilled
+#   at ``rate`` tokens per second, and each record passing takes one token.
+#   Records finding the bucket empty are dropped and counted; the next record
+#   passing for the key reports how many similar records were suppressed.
+#   Since the key uses the template (``record.msg``) rather than the final
+#   message, ``'failed: %s'`` with different arguments counts as one key.
+# * A formatter caching the formatted timestamp. ``%(asctime)s`` calls
+#   ``time.strftime()`` for every record, although the text only changes
+#   once per second (the milliseconds, if any, are added separately).
+
+class RateLimitFilter(logging.Filter):
+    """Let through ``burst`` records per key, then ``rate`` per second."""
+
+    def __init__(self, rate=1.0, burst=10, max_keys=10_000):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.suppressed = 0
+        # key -> [tokens, time of last refill, records suppressed since]
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        # records from BoundedQueueHandler carry their merged message in msg
+        template = getattr(record, 'template', record.msg)
+        key = (record.name, record.levelno, template)
+        now = record.created
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    # forget the oldest key
+                    del self._buckets[next(iter(self._buckets))]
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+            bucket[0] = tokens - 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.msg = f'{record.msg} ({suppressed} similar suppressed)'
+        return True
+
+
+class CachedTimeFormatter(logging.Formatter):
+    """``Formatter`` formatting the timestamp once per second."""
+
+    _cache = (None, '')
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        cached_second, text = self._cache
+        if second != cached_second:
+            text = time.strftime(datefmt or self.default_time_format,
+                                 self.converter(record.created))
+            # a single assignment, so threads never see a mismatched pair
+            self._cache = (second, text)
+        if datefmt is None and self.default_msec_format:
+            return self.default_msec_format % (text, record.msecs)
+        return text
+
+# %%
+# The formatted output is the same as with ``logging.Formatter``:
+
+fmt = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+datefmt = '%d-%b-%y %H:%M:%S'
+record = logging.makeLogRecord({'name': 'example', 'msg': 'hello',
+                                'levelname': 'INFO'})
+for args in [(fmt,), (fmt, datefmt)]:
+    assert (CachedTimeFormatter(*args).format(record)
+            == logging.Formatter(*args).format(record))
+    print(CachedTimeFormatter(*args).format(record))
+
+# %%
+# Let's time a storm: the same error, with its traceback, logged from a loop
+# to a file. First only the formatting of records without tracebacks is
+# compared, then the storm with and without the filter (allowing a burst of
+# 10 records, then 10 per second per key).
+
+def storm(handler, n, exc_info=True):
+    logger = logging.getLogger('storm')
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        1 / 0
+    except ZeroDivisionError as e:
+        error = e
+    t0 = time.perf_counter()
+    for i in range(n):
+        logger.error('failed to process item %d', i,
+                     exc_info=error if exc_info else None)
+    seconds = time.perf_counter() - t0
+    logger.removeHandler(handler)
+    handler.close()
+    return n / seconds
+
+def file_handler(formatter, filters=()):
+    handler = logging.FileHandler(os.path.join(tmp_dir.name, 'storm.log'),
+                                  'w')
+    handler.setFormatter(formatter)
+    for f in filters:
+        handler.addFilter(f)
+    return handler
+
+for name, formatter in [('Formatter', logging.Formatter(fmt, datefmt)),
+                        ('CachedTimeFormatter',
+                         CachedTimeFormatter(fmt, datefmt))]:
+    rate = storm(file_handler(formatter), 50_000, exc_info=False)
+    print(f'{name:20} no traceback  {rate:8.0f} records/s')
+
+rate_limit = RateLimitFilter(rate=10, burst=10)
+for name, filters in [('no filter', ()), ('RateLimitFilter', [rate_limit])]:
+    handler = file_handler(CachedTimeFormatter(fmt, datefmt), filters)
+    rate = storm(handler, 20_000)
+    with open(handler.baseFilename) as f:
+        lines = sum(1 for _ in f)
+    print(f'{name:20} with traceback {rate:8.0f} records/s, '
+          f'{lines} lines written')
+print(f'suppressed: {rate_limit.suppressed}')
+tmp_dir.cleanup()
+
+# %%
+# Caching the timestamp saves a ``strftime()`` call per record, a sizeable
+# part of the cost of formatting a short record. Rate limiting makes a larger
+# difference in a storm: a suppressed record is dropped before it is
+# formatted, so neither its message nor its traceback is ever rendered, and
+# the log file stays readable. The filter is best added to the handlers
+# (filters of a logger do not see the records propagated from its children).
+# Behind ``queue_logging``, a handler of the listener gets records whose
+# message has already been merged with its arguments, so the filter groups
+# them by the ``template`` that ``BoundedQueueHandler`` keeps on the record.
+# Adding it to the ``QueueHandler`` instead drops suppressed records before
+# they are queued.